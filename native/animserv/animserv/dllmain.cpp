@@ -25,6 +25,9 @@ typedef int64_t i64;
 
 constexpr i32 DEFAULT_BUFLEN = 1024;
 constexpr const char* DEFAULT_PORT = "54217";
+constexpr i32 MAX_BATCH_ENTRIES = 0x10000;
+// decoded data of a single batch response, larger batches are rejected so the client splits them
+constexpr u64 MAX_BATCH_BYTES = 64 * 1024 * 1024;
 
 typedef u64(__fastcall *AnimDecoder)(void* decodedDataOut, void* unkOut, void* animHeader,
 	void* frameSetData, i32 frameCount, i32 frameIdx, float framePart);
@@ -63,6 +66,29 @@ struct DecodeFrameResponse {
 	// decodedData[dataSize] follows...
 	DecodeFrameResponse() : id(0x3333) {}
 };
+
+struct DecodeFrameBatchRequest {
+	const i16 id;
+	i32 framesetDefOffset;
+	i32 frameCount;
+	i32 entryCount;
+	// DecodeFrameBatchEntry[entryCount] follows...
+	DecodeFrameBatchRequest() : id(0x3334) {}
+};
+
+struct DecodeFrameBatchEntry {
+	i32 frameIdx;
+	float framePart;
+};
+
+struct DecodeFrameBatchResponse {
+	const i16 id;
+	i16 error;
+	i32 entryCount;
+	i32 frameSize;
+	// decodedData[entryCount * frameSize] follows...
+	DecodeFrameBatchResponse() : id(0x3335) {}
+};
 #pragma pack(pop)
 
 class SocketStreamException : public std::runtime_error {
@@ -212,46 +238,97 @@ private:
 			const i32 frameIdx = m_socketStream.readInt();
 			const float framePart = m_socketStream.readFloat();
 			DecodeFrameResponse response;
-			if (m_currentFileBuf.size() < 0x40) {
-				response.error = 1;
-				response.dataSize = 0;
-				elog("decode failed, loaded file invalid");
-				sendResponse(&response, sizeof(response));
-				return;
-			}
-			if (framesetDefOffset > m_currentFileBuf.size()) {
-				response.error = 2;
+			response.error = validateDecode(framesetDefOffset, frameCount, frameIdx);
+			if (response.error != 0) {
 				response.dataSize = 0;
-				elog("decode failed, specified frameset out of bounds");
-				sendResponse(&response, sizeof(response));
-				return;
-			}
-			if (frameIdx > frameCount) {
-				response.error = 3;
-				response.dataSize = 0;
-				elog("decode failed, frame index out of bounds");
 				sendResponse(&response, sizeof(response));
 				return;
 			}
 
-			u16 boneCount = m_currentFileBuf[0xE] | (m_currentFileBuf[0xF] << 8);
-			u32 memoryNeeded = boneCount * 0x30 + 0x30;
+			u32 memoryNeeded = getDecodedFrameSize();
 			u8* decodedData = new u8[memoryNeeded];
 			log("decode frame ", frameIdx, ", frame part ", framePart);
 			m_animDecoder(decodedData, nullptr, m_currentFileBuf.data(), m_currentFileBuf.data() + framesetDefOffset, frameCount,
 				frameIdx, framePart);
-			response.error = 0;
 			response.dataSize = memoryNeeded;
 			sendResponse(&response, sizeof(response), decodedData, memoryNeeded);
 			delete[] decodedData;
 			break;
 		}
+		case 0x3334: {
+			const i32 framesetDefOffset = m_socketStream.readInt();
+			const i32 frameCount = m_socketStream.readInt();
+			const i32 entryCount = m_socketStream.readInt();
+			DecodeFrameBatchResponse response;
+			response.entryCount = 0;
+			response.frameSize = 0;
+			if (entryCount < 0 || entryCount > MAX_BATCH_ENTRIES) {
+				response.error = 4;
+				elog("batch decode failed, invalid entry count ", entryCount);
+				sendResponse(&response, sizeof(response));
+				throw std::runtime_error("invalid batch entry count");
+			}
+			std::vector<DecodeFrameBatchEntry> entries(entryCount);
+			for (auto& entry : entries) {
+				entry.frameIdx = m_socketStream.readInt();
+				entry.framePart = m_socketStream.readFloat();
+			}
+			for (const auto& entry : entries) {
+				response.error = validateDecode(framesetDefOffset, frameCount, entry.frameIdx);
+				if (response.error != 0) {
+					sendResponse(&response, sizeof(response));
+					return;
+				}
+			}
+
+			const u32 frameSize = getDecodedFrameSize();
+			const u64 decodedSize = (u64)frameSize * entryCount;
+			if (decodedSize > MAX_BATCH_BYTES) {
+				// request was read fully so the connection stays usable, client splits the batch and retries
+				response.error = 5;
+				elog("batch decode failed, ", decodedSize, " bytes of decoded data exceeds limit");
+				sendResponse(&response, sizeof(response));
+				return;
+			}
+			std::vector<u8> decodedData((size_t)decodedSize);
+			log("decode frame batch of ", entryCount, " frames at frameset 0x", std::hex, framesetDefOffset, std::dec);
+			for (i32 i = 0; i < entryCount; i++) {
+				m_animDecoder(decodedData.data() + (size_t)frameSize * i, nullptr, m_currentFileBuf.data(),
+					m_currentFileBuf.data() + framesetDefOffset, frameCount, entries[i].frameIdx, entries[i].framePart);
+			}
+			response.error = 0;
+			response.entryCount = entryCount;
+			response.frameSize = frameSize;
+			sendResponse(&response, sizeof(response), decodedData.data(), (i32)decodedData.size());
+			break;
+		}
 		default:
 			elog("unsupported packet id ", packetId);
 			throw std::runtime_error("unsupported packet type");
 		}
 	}
 
+	i16 validateDecode(i32 framesetDefOffset, i32 frameCount, i32 frameIdx) {
+		if (m_currentFileBuf.size() < 0x40) {
+			elog("decode failed, loaded file invalid");
+			return 1;
+		}
+		if (framesetDefOffset > m_currentFileBuf.size()) {
+			elog("decode failed, specified frameset out of bounds");
+			return 2;
+		}
+		if (frameIdx > frameCount) {
+			elog("decode failed, frame index out of bounds");
+			return 3;
+		}
+		return 0;
+	}
+
+	u32 getDecodedFrameSize() {
+		u16 boneCount = m_currentFileBuf[0xE] | (m_currentFileBuf[0xF] << 8);
+		return boneCount * 0x30 + 0x30;
+	}
+
 	void sendResponse(const void* data, i32 dataLen) {
 		return sendResponse(data, dataLen, nullptr, 0);
 	}
@@ -368,6 +445,9 @@ u32 startServerSocket(AnimDecoder animDecoder) {
 			return 1;
 		}
 
+		// responses are sent as header and data, don't let Nagle delay the data part
+		BOOL noDelay = TRUE;
+		setsockopt(clientSocket, IPPROTO_TCP, TCP_NODELAY, (const char*)&noDelay, sizeof(noDelay));
 		new RemoteClient(animDecoder, connectionId++, clientSocket);
 	}
 }
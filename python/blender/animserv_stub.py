@@ -0,0 +1,225 @@
+# Pure Python stand-in for native/animserv
+
+# Implements the same protocol as animserv but returns deterministic synthetic frames
+# instead of calling the game decoder. Allows testing and benchmarking import_mtb.py
+# without Windows and the game process.
+
+# Usage: python animserv_stub.py [--port 54217] [--bones N | --mdl file.mdl] [--latency ms] [--frame-time ms]
+
+from struct import *
+from array import array
+from pathlib import Path
+import argparse
+import math
+import socket
+import socketserver
+import sys
+import threading
+import queue
+import time
+
+defaultPort = 54217
+
+# Must match MAX_BATCH_ENTRIES and MAX_BATCH_BYTES in animserv
+maxBatchEntries = 0x10000
+maxBatchBytes = 64 * 1024 * 1024
+
+class StubConfig:
+    def __init__(self, boneCount=None, latency=0.0, frameTime=0.0, verbose=False):
+        # bone count of generated frames, when None it is read from loaded .mtb header like animserv does
+        self.boneCount = boneCount
+        # delay in seconds added to delivery of each response, responses are still processed
+        # without waiting for previous ones so this behaves like network round trip time
+        self.latency = latency
+        # simulated decode time in seconds of a single frame
+        self.frameTime = frameTime
+        self.verbose = verbose
+
+def synthesizeFrame(boneCount: int, framesetDefOffset: int, frameCount: int, frameIdx: int, framePart: float):
+    # same layout as decoded game frames: boneCount * (rotation xyzw, translation xyz + pad, scale xyz + pad)
+    # followed by 0x30 bytes of unused data
+    frame = array('f', bytes(boneCount * 0x30 + 0x30))
+    frameTime = frameIdx + framePart
+    for boneIdx in range(0, boneCount):
+        angle = 0.05 * frameTime * (1 + boneIdx % 7) + 0.01 * framesetDefOffset
+        base = boneIdx * 12
+        frame[base + 2] = math.sin(angle / 2)
+        frame[base + 3] = math.cos(angle / 2)
+        frame[base + 4] = boneIdx * 1.5
+        frame[base + 5] = math.sin(angle) * 10.0
+        frame[base + 6] = frameTime / max(frameCount, 1)
+        frame[base + 8] = 10.0
+        frame[base + 9] = 10.0
+        frame[base + 10] = 10.0
+    return frame.tobytes()
+
+class StubRequestHandler(socketserver.BaseRequestHandler):
+    def setup(self):
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.config = self.server.config
+        self.currentFile = b''
+        self.sendQueue = None
+        if self.config.latency > 0:
+            self.sendQueue = queue.Queue()
+            threading.Thread(target=self.delayedSender, daemon=True).start()
+        self.log("accepted connection")
+
+    def finish(self):
+        if self.sendQueue is not None:
+            self.sendQueue.put(None)
+
+    def handle(self):
+        try:
+            while True:
+                packetId, = unpack("<h", self.recvall(2))
+                if packetId == 0x3330:
+                    self.handleLoadFile()
+                elif packetId == 0x3332:
+                    self.handleDecodeFrame()
+                elif packetId == 0x3334:
+                    self.handleDecodeFrameBatch()
+                else:
+                    self.log("unsupported packet id %d" % packetId)
+                    return
+        except ConnectionError as e:
+            self.log(str(e))
+
+    def handleLoadFile(self):
+        path = self.recvall(256).decode("utf-16le").split("\0", 1)[0]
+        if "\\" in path and not Path(path).exists():
+            path = path.replace("\\", "/")
+        self.log("load file: " + path)
+        try:
+            self.currentFile = Path(path).read_bytes()
+            error = 0
+        except OSError:
+            self.currentFile = b''
+            error = 1
+        self.sendResponse(pack("<hh", 0x3331, error))
+
+    def handleDecodeFrame(self):
+        framesetDefOffset, frameCount, frameIdx, framePart = unpack("<3if", self.recvall(16))
+        error = self.validateDecode(framesetDefOffset, frameCount, frameIdx)
+        if error != 0:
+            self.sendResponse(pack("<2hi", 0x3333, error, 0))
+            return
+        self.log("decode frame %d, frame part %f" % (frameIdx, framePart))
+        decodedData = self.decodeFrame(framesetDefOffset, frameCount, frameIdx, framePart)
+        self.sendResponse(pack("<2hi", 0x3333, 0, len(decodedData)), decodedData)
+
+    def handleDecodeFrameBatch(self):
+        framesetDefOffset, frameCount, entryCount = unpack("<3i", self.recvall(12))
+        if entryCount < 0 or entryCount > maxBatchEntries:
+            self.sendResponse(pack("<2h2i", 0x3335, 4, 0, 0))
+            raise ConnectionError("invalid batch entry count")
+        entries = list(iter_unpack("<if", self.recvall(entryCount * 8)))
+        for frameIdx, framePart in entries:
+            error = self.validateDecode(framesetDefOffset, frameCount, frameIdx)
+            if error != 0:
+                self.sendResponse(pack("<2h2i", 0x3335, error, 0, 0))
+                return
+        frameSize = self.getDecodedFrameSize()
+        if frameSize * entryCount > maxBatchBytes:
+            self.log("batch decode failed, %d bytes of decoded data exceeds limit" % (frameSize * entryCount))
+            self.sendResponse(pack("<2h2i", 0x3335, 5, 0, 0))
+            return
+        self.log("decode frame batch of %d frames at frameset 0x%x" % (entryCount, framesetDefOffset))
+        decodedData = b''.join(self.decodeFrame(framesetDefOffset, frameCount, frameIdx, framePart)
+                               for frameIdx, framePart in entries)
+        self.sendResponse(pack("<2h2i", 0x3335, 0, entryCount, frameSize), decodedData)
+
+    def validateDecode(self, framesetDefOffset: int, frameCount: int, frameIdx: int):
+        if len(self.currentFile) < 0x40:
+            self.log("decode failed, loaded file invalid")
+            return 1
+        if framesetDefOffset > len(self.currentFile):
+            self.log("decode failed, specified frameset out of bounds")
+            return 2
+        if frameIdx > frameCount:
+            self.log("decode failed, frame index out of bounds")
+            return 3
+        return 0
+
+    def getDecodedFrameSize(self):
+        return self.getBoneCount() * 0x30 + 0x30
+
+    def getBoneCount(self):
+        if self.config.boneCount is not None:
+            return self.config.boneCount
+        return unpack_from("<H", self.currentFile, 0xE)[0]
+
+    def decodeFrame(self, framesetDefOffset: int, frameCount: int, frameIdx: int, framePart: float):
+        if self.config.frameTime > 0:
+            time.sleep(self.config.frameTime)
+        return synthesizeFrame(self.getBoneCount(), framesetDefOffset, frameCount, frameIdx, framePart)
+
+    def sendResponse(self, response, dataTail=None):
+        if self.sendQueue is not None:
+            self.sendQueue.put((time.perf_counter() + self.config.latency, response, dataTail))
+            return
+        self.request.sendall(response)
+        if dataTail is not None:
+            self.request.sendall(dataTail)
+
+    def delayedSender(self):
+        while True:
+            item = self.sendQueue.get()
+            if item is None:
+                return
+            deliverAt, response, dataTail = item
+            delay = deliverAt - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                self.request.sendall(response)
+                if dataTail is not None:
+                    self.request.sendall(dataTail)
+            except OSError:
+                return
+
+    def recvall(self, n):
+        buffer = bytearray(n)
+        view = memoryview(buffer)
+        received = 0
+        while received < n:
+            count = self.request.recv_into(view[received:], n - received)
+            if count == 0:
+                raise ConnectionError("connection closed")
+            received += count
+        return buffer
+
+    def log(self, msg):
+        if self.config.verbose:
+            print("[*] [%s:%d] %s" % (self.client_address[0], self.client_address[1], msg))
+
+class StubServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, config: StubConfig):
+        super().__init__(address, StubRequestHandler)
+        self.config = config
+
+def main():
+    parser = argparse.ArgumentParser(description="Pure Python stand-in for animserv")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=defaultPort)
+    parser.add_argument("--bones", type=int, help="bone count of generated frames, defaults to .mtb header value")
+    parser.add_argument("--mdl", help="take bone count of generated frames from this .mdl")
+    parser.add_argument("--latency", type=float, default=0.0, help="delay in ms before each response")
+    parser.add_argument("--frame-time", type=float, default=0.0, help="simulated decode time in ms per frame")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    boneCount = args.bones
+    if args.mdl is not None:
+        sys.path.insert(0, str(Path(__file__).resolve().parent))
+        import import_mtb
+        boneCount = len(import_mtb.readMdlBoneList(args.mdl))
+    config = StubConfig(boneCount, args.latency / 1000.0, args.frame_time / 1000.0, args.verbose)
+    with StubServer((args.host, args.port), config) as server:
+        print("[*] server started using port %d" % server.server_address[1])
+        server.serve_forever()
+
+if __name__ == "__main__":
+    main()
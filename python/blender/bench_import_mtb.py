@@ -0,0 +1,134 @@
+# Benchmark for the network and decode path of import_mtb.py
+
+# Runs outside of Blender against animserv_stub.py started in the same process, or against
+# a running animserv when --address is given. Synthetic .mdl and .mtb files are generated
+# unless --mdl and --mtb point to real ones.
+
+# Usage: python bench_import_mtb.py [--files 8] [--frames 120] [--bones 150] [--latency 0.2] [--connections 4]
+
+from struct import *
+from pathlib import Path
+import argparse
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+import animserv_stub
+import import_mtb
+
+def writeSyntheticMdl(path: Path, boneCount: int):
+    # only the parts read by readMdlBoneList: bone section offset, bone count and bone names
+    boneSectOffset = 0x40
+    boneNamesHeader = 0x80
+    boneNamesTable = boneNamesHeader + 0x1C
+    data = bytearray(boneNamesTable + boneCount * 4)
+    pack_into("<i", data, 0x1C, boneSectOffset)
+    pack_into("<i", data, boneSectOffset + 0x10, boneCount)
+    pack_into("<i", data, boneSectOffset + 0x30, boneNamesHeader - (boneSectOffset + 0x30))
+    for boneIdx in range(0, boneCount):
+        tableEntry = boneNamesTable + boneIdx * 4
+        pack_into("<i", data, tableEntry, len(data) - tableEntry)
+        data += ("bone_%03d" % boneIdx).encode("ascii") + b'\0'
+    path.write_bytes(data)
+
+def writeSyntheticMtb(path: Path, boneCount: int, frameCounts):
+    # header fields read by readFrameSetInfo and animserv, frame set data is not used by animserv_stub
+    frameSetInfoOffset1 = 0x40
+    frameSetInfoOffset2 = frameSetInfoOffset1 + len(frameCounts) * 8
+    frameSetDataOffset = frameSetInfoOffset2 + len(frameCounts) * 4
+    data = bytearray(frameSetDataOffset + len(frameCounts) * 0x10)
+    pack_into("<H", data, 0xE, boneCount)
+    pack_into("<h", data, 0x12, len(frameCounts))
+    pack_into("<i", data, 0x38, frameSetInfoOffset1 - 0x38)
+    pack_into("<i", data, 0x3C, frameSetInfoOffset2 - 0x3C)
+    for frameSetIdx, frameCount in enumerate(frameCounts):
+        pack_into("<2i", data, frameSetInfoOffset1 + frameSetIdx * 8, 0, frameSetDataOffset + frameSetIdx * 0x10)
+        pack_into("<2h", data, frameSetInfoOffset2 + frameSetIdx * 4, 0, frameCount)
+    path.write_bytes(data)
+
+def timed(timings, stage, func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+    return result
+
+def runBenchmark(mdlPath: Path, mtbFiles, frameParts):
+    timings = {}
+    boneNames = timed(timings, "read bone list", import_mtb.readMdlBoneList, str(mdlPath))
+    for mtbFile in mtbFiles:
+        timed(timings, "read frame set info", import_mtb.readFrameSetInfo, str(mtbFile))
+    decodedFiles = timed(timings, "decode", import_mtb.decodeMtbFiles, mtbFiles, frameParts)
+    frameCount = 0
+    for decodedFrameSets in decodedFiles:
+        for frames in decodedFrameSets:
+            timed(timings, "unpack", import_mtb.unpackFrames, frames, len(boneNames))
+            frameCount += len(frames)
+    return frameCount, timings
+
+def printReport(frameCount: int, timings):
+    total = sum(timings.values())
+    print("%-24s %10s %8s" % ("stage", "time [ms]", "share"))
+    for stage, elapsed in timings.items():
+        print("%-24s %10.2f %7.1f%%" % (stage, elapsed * 1000.0, 100.0 * elapsed / total if total > 0 else 0.0))
+    print("%-24s %10.2f" % ("total", total * 1000.0))
+    print("frames: %d, decode: %.1f frames/sec, overall: %.1f frames/sec" %
+          (frameCount, frameCount / timings["decode"] if timings["decode"] > 0 else 0.0,
+           frameCount / total if total > 0 else 0.0))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark import_mtb.py network and decode path")
+    parser.add_argument("--address", help="host:port of a running animserv, by default animserv_stub is started")
+    parser.add_argument("--mdl", help="use this .mdl instead of a synthetic one")
+    parser.add_argument("--mtb", help="use this .mtb file or directory instead of synthetic ones")
+    parser.add_argument("--files", type=int, default=8, help="synthetic .mtb file count")
+    parser.add_argument("--frame-sets", type=int, default=2, help="frame sets per synthetic .mtb")
+    parser.add_argument("--frames", type=int, default=120, help="frames per synthetic frame set")
+    parser.add_argument("--bones", type=int, default=150, help="bone count of synthetic files")
+    parser.add_argument("--latency", type=float, default=0.0, help="animserv_stub response delay in ms")
+    parser.add_argument("--frame-time", type=float, default=0.0, help="animserv_stub decode time in ms per frame")
+    parser.add_argument("--frame-part-div", type=int, default=import_mtb.framePartDiv)
+    parser.add_argument("--batched", type=int, default=int(import_mtb.useBatchedDecode), help="1 to use batched decode")
+    parser.add_argument("--window", type=int, default=import_mtb.decodePipelineWindow, help="pipeline window")
+    parser.add_argument("--connections", type=int, default=import_mtb.decodeConnections, help="animserv connections")
+    args = parser.parse_args()
+
+    import_mtb.framePartDiv = args.frame_part_div
+    import_mtb.useBatchedDecode = args.batched != 0
+    import_mtb.decodePipelineWindow = args.window
+    import_mtb.decodeConnections = args.connections
+
+    server = None
+    if args.address is None:
+        config = animserv_stub.StubConfig(latency=args.latency / 1000.0, frameTime=args.frame_time / 1000.0)
+        server = animserv_stub.StubServer(("127.0.0.1", 0), config)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        import_mtb.animservAddress = server.server_address
+    else:
+        host, port = args.address.rsplit(":", 1)
+        import_mtb.animservAddress = (host, int(port))
+
+    with tempfile.TemporaryDirectory() as tmpDir:
+        if args.mdl is not None:
+            mdlPath = Path(args.mdl)
+        else:
+            mdlPath = Path(tmpDir) / "bench.mdl"
+            writeSyntheticMdl(mdlPath, args.bones)
+        if args.mtb is not None:
+            mtb = Path(args.mtb)
+            mtbFiles = sorted(mtb.glob("*.mtb")) if mtb.is_dir() else [mtb]
+        else:
+            mtbFiles = []
+            for fileIdx in range(0, args.files):
+                mtbFile = Path(tmpDir) / ("bench_%03d.mtb" % fileIdx)
+                writeSyntheticMtb(mtbFile, args.bones, [args.frames] * args.frame_sets)
+                mtbFiles.append(mtbFile)
+        frameCount, timings = runBenchmark(mdlPath, mtbFiles, import_mtb.getFrameParts())
+    if server is not None:
+        server.shutdown()
+        server.server_close()
+    printReport(frameCount, timings)
+
+if __name__ == "__main__":
+    main()
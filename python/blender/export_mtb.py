@@ -0,0 +1,61 @@
+# Exports decoded Fate/Extella .mtb animation to .npz clip arrays without Blender
+
+# Make sure animserv is running before executing this script
+# Exported clips can be imported in Blender by setting clipArraysPath in import_mtb.py
+
+# Each .mtb is written as <out dir>/<mtb name>.npz containing:
+# boneNames: MDL bone names
+# trs: (bones, frames, 10) float32 array of translation xyz, rotation wxyz, scale xyz
+# frameSetFrames: frame count of each frame set
+
+# Usage: python export_mtb.py model.mdl motion_dir_or_file out_dir [--connections 4] [--frame-part-div 3]
+#        python export_mtb.py model.mdl motion_dir_or_file --list
+
+from pathlib import Path
+import argparse
+import sys
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+import import_mtb
+
+def main():
+    parser = argparse.ArgumentParser(description="Export decoded .mtb animation to .npz clip arrays")
+    parser.add_argument("mdl", help=".mdl file of animated model")
+    parser.add_argument("mtb", help=".mtb file or directory with .mtb files")
+    parser.add_argument("outDir", nargs="?", help="output directory")
+    parser.add_argument("--address", help="host:port of animserv")
+    parser.add_argument("--connections", type=int, default=import_mtb.decodeConnections, help="animserv connections")
+    parser.add_argument("--frame-part-div", type=int, default=import_mtb.framePartDiv)
+    parser.add_argument("--cache-dir", help="frame cache directory, disabled by default")
+    parser.add_argument("--cache-max-size", type=int, default=import_mtb.frameCacheMaxSize)
+    parser.add_argument("--list", action="store_true", help="only list frame counts of each .mtb, animserv is not needed")
+    parser.add_argument("--index", action="store_true",
+                        help="read and update .mtb_index.json files in the .mtb and .mdl directories")
+    args = parser.parse_args()
+    if args.outDir is None and not args.list:
+        parser.error("outDir is required unless --list is used")
+
+    fileIndex = import_mtb.FileIndex() if args.index else None
+    if args.list:
+        for mtbFile, frameCounts in import_mtb.listClipLengths(args.mtb, fileIndex):
+            print("%s: %s" % (mtbFile.name, ", ".join(str(x) for x in frameCounts)))
+        return
+
+    import_mtb.decodeConnections = args.connections
+    import_mtb.framePartDiv = args.frame_part_div
+    if args.address is not None:
+        host, port = args.address.rsplit(":", 1)
+        import_mtb.animservAddress = (host, int(port))
+    frameCache = None
+    if args.cache_dir is not None:
+        frameCache = import_mtb.FrameCache(Path(args.cache_dir), args.cache_max_size)
+
+    start = time.perf_counter()
+    outFiles = import_mtb.exportMtb(args.mdl, args.mtb, args.outDir, frameCache, fileIndex)
+    print("Exported %d clips in %.2f s" % (len(outFiles), time.perf_counter() - start))
+    if frameCache is not None:
+        print("Frame cache: %d hits, %d misses" % (frameCache.hits, frameCache.misses))
+
+if __name__ == "__main__":
+    main()
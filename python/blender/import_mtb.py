@@ -11,6 +11,10 @@
 mdlPath = "ch002_m01_00.mdl"
 mtbPath = "motion/ch002_m01_0202.mtb"
 
+# Clip arrays written by export_mtb.py, file or directory
+# When set those are imported instead of mdlPath and mtbPath, animserv is not needed
+clipArraysPath = None
+
 # Name of Blender skeleton to which animation data will be applied
 blenderSkeletonTarget = "Armature"
 
@@ -22,81 +26,398 @@ framePartDiv = 3
 # Set to True to avoid weird artifacts when testing multiple animations
 deleteOldKeyframes = True
 
+# Collect all decoded frames first and write them into F-curves in one pass
+# Much faster than inserting keyframes one by one, set to False to use keyframe_insert
+bulkKeyframes = True
+
+# Decode whole frame sets with a single request instead of one request per frame
+# Requires animserv build with batch decode support, set to False for older builds
+useBatchedDecode = True
+
+# Number of single frame decode requests kept in flight when batched decode is disabled
+# Set to 1 to wait for each frame before requesting the next one
+decodePipelineWindow = 32
+
+# Number of animserv connections used to decode files in parallel when mtbPath is a directory
+decodeConnections = 4
+
+# Decoded frames are processed in chunks of at most this many frames, each connection keeps at most
+# streamMaxPendingChunks chunks waiting for Blender so memory use doesn't grow with the number of imported clips
+# Chunks are written to the frame cache as they arrive, only kept keys are buffered until F-curves are written
+# in one pass at the end, so memory grows with clip length only by the keys Blender ends up holding anyway
+streamChunkFrames = 512
+streamMaxPendingChunks = 4
+
+# Directory where decoded frames are cached between imports, disabled when None
+# To enable it set a directory name, e.g. "animserv_cache", relative paths are next to current Blender file
+# Cached files are reused as long as the .mtb content and framePartDiv stay the same,
+# each imported .mtb is hashed to check that, which adds some startup time
+frameCacheDir = None
+
+# Maximum size of the frame cache in bytes, least recently used entries are removed first
+frameCacheMaxSize = 1024 * 1024 * 1024
+
+# Drop keys which linear interpolation of neighbouring keys reproduces within given tolerances
+# Reduced F-curves use linear interpolation, only used when bulkKeyframes is True
+reduceKeyframes = False
+# Maximum location error in Blender units, maximum rotation error in radians
+# Scale has no tolerance and isn't reduced: pushLocalFrame and bulk keyframes key the current pose bone
+# scale instead of decoded scales, so scale keys are constant and only first and last key of each chunk are kept
+locationTolerance = 0.0001
+rotationTolerance = 0.0005
+
+# Record count, total and percentile time of each import stage and print a report when import finishes
+# Set profileJsonPath to also write the report as JSON
+profileImport = False
+profileJsonPath = None
+
+# Keep an index of .mtb frame set tables and .mdl bone lists in each directory (.mtb_index.json)
+# Index entries are updated when file size or modification time changes
+# Disabled by default because it writes a hidden .mtb_index.json file into the motion directory and
+# the directory of the .mdl, which are often extracted game files
+useFileIndex = False
+
 # ----------------------------------------------
 
 from struct import *
 from pathlib import Path
+import numpy as np
 import socket
-import bpy
+import threading
+import queue
+import hashlib
+import mmap
+import json
 import os
+import time
+import contextlib
+
+try:
+    import bpy
+except ImportError:
+    # network and decoding functions can be used outside of Blender
+    bpy = None
+
+animservAddress = ("127.0.0.1", 54217)
+
+# Must match MAX_BATCH_ENTRIES in animserv
+# Batches with more than MAX_BATCH_BYTES of decoded data are rejected by animserv with error 5 and split in halves
+maxBatchEntries = 0x10000
+
+# Profiler of current import when profileImport is enabled
+profiler = None
 
 def importMtb():
-    mdl = Path(mdlPath)
-    mtb = Path(mtbPath)
+    global profiler
+    profiler = Profiler() if profileImport else None
     blenderFileDir = os.path.dirname(bpy.data.filepath)
     os.chdir(blenderFileDir)
-    if not mdl.is_file():
-        raise ValueError("MDL file does not exist")
-    if not mtb.is_file() and not mtb.is_dir():
-        raise ValueError("MTB file or dir does not exist")
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    sock.connect(("127.0.0.1", 54217))
-    mdlBoneNames = readMdlBoneList()
-    frameParts = getFrameParts()
-    framePartsCount = len(frameParts)
+    frameCache = None
+    fileIndex = None
+    if clipArraysPath is not None:
+        boneNames, unpackedFrameSets = readClipArraysPath(Path(clipArraysPath))
+    else:
+        mdl = Path(mdlPath)
+        mtb = Path(mtbPath)
+        if not mdl.is_file():
+            raise ValueError("MDL file does not exist")
+        if not mtb.is_file() and not mtb.is_dir():
+            raise ValueError("MTB file or dir does not exist")
+        if useFileIndex:
+            fileIndex = FileIndex()
+        boneNames = fileIndex.readMdlBoneList(mdl) if fileIndex is not None else readMdlBoneList(mdlPath)
+        if frameCacheDir is not None:
+            frameCache = FrameCache(Path(frameCacheDir), frameCacheMaxSize)
+        unpackedFrameSets = unpackMtbFiles(listMtbFiles(mtb, fileIndex), len(boneNames), frameCache, fileIndex)
+    with measure("bone lookup"):
+        blenderBones = getBlenderBoneMap(boneNames)
     if deleteOldKeyframes:
          bpy.data.objects[blenderSkeletonTarget].animation_data_clear()
     ctx = bpy.context
     frameCount = 0
-    
-    mtbToImport = []
-    if mtb.is_file():
-        mtbToImport.append(mtb)
-    else:
-        mtbListing = mtb.glob('*.mtb')
-        mtbToImport.extend([x for x in mtbListing if x.is_file()])
-    
-    for mtbFile in mtbToImport:
-        mtbFrameSetOffsets, mtbFrameCounts = readFrameSetInfo(str(mtbFile.resolve()))
-        remoteLoadFile(sock, mtbFile)
-        for frameSetIdx in range(0, len(mtbFrameCounts)):
-            if mtbFrameCounts[frameSetIdx] != 0:
-                for idx in range(0, mtbFrameCounts[frameSetIdx] + 1):
-                    for partIdx, part in enumerate(frameParts):
-                        frameData = remoteDecodeFrame(sock, mtbFrameSetOffsets[frameSetIdx], idx, mtbFrameCounts[frameSetIdx], part)
-                        pushLocalFrame(frameData, mdlBoneNames, frameCount)
-                        frameCount += 1
-            else:
-                frameData = remoteDecodeFrame(sock, mtbFrameSetOffsets[frameSetIdx], 0, mtbFrameCounts[frameSetIdx], 0)
-                pushLocalFrame(frameData, mdlBoneNames, frameCount)
-                frameCount += 1   
+
+    keyframeBuffer = KeyframeBuffer(blenderBones) if bulkKeyframes else None
+    for fileName, frameSetLength, unpackedFrames in unpackedFrameSets:
+        if unpackedFrames is None:
+            for frameIdx in range(frameCount, frameCount + frameSetLength):
+                print("WARN: Too small frame data, dropping frame %d" % frameIdx)
+            frameCount += frameSetLength
+            continue
+        locations, scales, rotations = unpackedFrames
+        if keyframeBuffer is not None:
+            with measure("buffer keyframes", fileName):
+                keyframeBuffer.addFrames(frameCount, locations, rotations)
+        else:
+            for idx in range(0, frameSetLength):
+                with measure("keyframe_insert", fileName):
+                    pushLocalFrame(blenderBones, frameCount + idx, locations[idx], scales[idx], rotations[idx])
+        frameCount += frameSetLength
+    if keyframeBuffer is not None:
+        with measure("write F-curves"):
+            keyframeBuffer.commit(bpy.data.objects[blenderSkeletonTarget])
     ctx.scene.frame_start = 0
     ctx.scene.frame_end = frameCount - 1
     ctx.scene.frame_current = 0
-    sock.close()
-    
+    if fileIndex is not None:
+        fileIndex.save()
+    if frameCache is not None:
+        print("Frame cache: %d hits, %d misses" % (frameCache.hits, frameCache.misses))
+    if profiler is not None:
+        report = profiler.getReport()
+        profiler.printReport(report)
+        if profileJsonPath is not None:
+            with open(profileJsonPath, 'w') as file:
+                json.dump(report, file, indent=2)
+
+def exportMtb(mdlPath, mtbPath, outDir, frameCache=None, fileIndex=None):
+    # Blender independent entry point, writes decoded animation of each .mtb file to <outDir>/<mtb name>.npz
+    # Uses the same decoding settings as importMtb, returns list of written files
+    boneNames = fileIndex.readMdlBoneList(mdlPath) if fileIndex is not None else readMdlBoneList(mdlPath)
+    mtbFiles = listMtbFiles(Path(mtbPath), fileIndex)
+    outDir = Path(outDir)
+    outDir.mkdir(parents=True, exist_ok=True)
+    outFiles = []
+    for mtbFile, chunks in streamMtbFiles(mtbFiles, getFrameParts(), frameCache, fileIndex):
+        outFile = outDir / (mtbFile.stem + ".npz")
+        writeClipArrays(outFile, boneNames, collectFrameSets(chunks))
+        outFiles.append(outFile)
+    if fileIndex is not None:
+        fileIndex.save()
+    return outFiles
+
+def listClipLengths(mtbPath, fileIndex=None):
+    # returns (.mtb file, frame counts of its frame sets) without decoding anything
+    clipLengths = []
+    for mtbFile in listMtbFiles(Path(mtbPath), fileIndex):
+        if fileIndex is not None:
+            clipLengths.append((mtbFile, fileIndex.readFrameSetInfo(mtbFile)[1]))
+        else:
+            clipLengths.append((mtbFile, readFrameSetInfo(str(mtbFile))[1]))
+    if fileIndex is not None:
+        fileIndex.save()
+    return clipLengths
+
+def listMtbFiles(mtb: Path, fileIndex=None):
+    if mtb.is_file():
+        return [mtb]
+    if not mtb.is_dir():
+        raise ValueError("MTB file or dir does not exist")
+    if fileIndex is not None:
+        return fileIndex.listFiles(mtb, ".mtb")
+    return [x for x in sorted(mtb.glob('*.mtb')) if x.is_file()]
+
+def unpackMtbFiles(mtbFiles, boneCount: int, frameCache=None, fileIndex=None):
+    # yields (file name, frame count, (locations, scales, rotations)) for each decoded chunk of a frame set
+    # unpacked frames are None when decoded data is too small for the MDL bone count
+    for mtbFile, chunks in streamMtbFiles(mtbFiles, getFrameParts(), frameCache, fileIndex):
+        for frameSetIdx, frames in chunks:
+            if frames.shape[1] * 4 < 0x30 * boneCount:
+                yield mtbFile.name, len(frames), None
+            else:
+                with measure("unpack", mtbFile.name):
+                    unpackedFrames = unpackFrames(frames, boneCount)
+                yield mtbFile.name, len(frames), unpackedFrames
+
+def writeClipArrays(path: Path, boneNames, decodedFrameSets):
+    # trs: (bones, frames, 10) float32 array of translation xyz, rotation wxyz, scale xyz per bone and frame
+    # frameSetFrames: frame count of each frame set, frame sets are stored one after another
+    frameSetFrames = np.array([len(frames) for frames in decodedFrameSets], dtype=np.int32)
+    frames = np.concatenate(decodedFrameSets) if decodedFrameSets else np.empty((0, len(boneNames) * 12), dtype='<f4')
+    if frames.shape[1] * 4 < 0x30 * len(boneNames):
+        raise ValueError("Decoded frame data too small for MDL bone count: " + str(path))
+    locations, scales, rotations = unpackFrames(frames, len(boneNames))
+    trs = np.concatenate((locations, rotations, scales), axis=2).transpose(1, 0, 2)
+    np.savez(path, boneNames=np.array(boneNames), trs=np.ascontiguousarray(trs, dtype=np.float32),
+             frameSetFrames=frameSetFrames)
+
+def readClipArrays(path: Path):
+    # returns bone names and (frames, bones, n) locations, scales and rotations like unpackFrames
+    with np.load(path) as clip:
+        boneNames = [str(name) for name in clip["boneNames"]]
+        trs = clip["trs"].transpose(1, 0, 2)
+    return boneNames, (trs[:, :, 0:3], trs[:, :, 7:10], trs[:, :, 3:7])
+
+def readClipArraysPath(clipPath: Path):
+    if clipPath.is_file():
+        clipFiles = [clipPath]
+    elif clipPath.is_dir():
+        clipFiles = [x for x in sorted(clipPath.glob('*.npz')) if x.is_file()]
+    else:
+        raise ValueError("Clip arrays file or dir does not exist")
+    boneNames = []
+    if clipFiles:
+        with np.load(clipFiles[0]) as clip:
+            boneNames = [str(name) for name in clip["boneNames"]]
+
+    def readClips():
+        # clips are read one at a time while importing
+        for clipFile in clipFiles:
+            clipBoneNames, unpackedFrames = readClipArrays(clipFile)
+            if boneNames != clipBoneNames:
+                raise ValueError("Clip arrays exported for different model: " + str(clipFile))
+            yield clipFile.name, len(unpackedFrames[0]), unpackedFrames
+
+    return boneNames, readClips()
+
+def decodeMtbFiles(mtbFiles, frameParts, frameCache=None, fileIndex=None):
+    # returns list of decoded (frames, frameSize / 4) float arrays of each frame set for each file
+    return [collectFrameSets(chunks) for mtbFile, chunks in streamMtbFiles(mtbFiles, frameParts, frameCache, fileIndex)]
+
+def streamMtbFiles(mtbFiles, frameParts, frameCache=None, fileIndex=None):
+    # yields (mtb file, chunks) in input order, chunks yields (frame set index, frames) of that file
+    # and must be consumed before moving to the next file
+    # each worker uses its own connection and decodes whole files, decoded chunks wait in a bounded
+    # queue of each file so workers stop decoding when the consumer falls behind
+    chunkQueues = [queue.Queue(streamMaxPendingChunks) for _ in mtbFiles]
+    pending = queue.Queue()
+    for fileIdx in range(0, len(mtbFiles)):
+        pending.put(fileIdx)
+    stopped = threading.Event()
+
+    def putChunk(chunkQueue, item):
+        while not stopped.is_set():
+            try:
+                chunkQueue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def worker():
+        conn = AnimservConnection()
+        try:
+            while not stopped.is_set():
+                try:
+                    fileIdx = pending.get_nowait()
+                except queue.Empty:
+                    return
+                chunkQueue = chunkQueues[fileIdx]
+                try:
+                    for chunk in decodeMtbFile(conn, mtbFiles[fileIdx], frameParts, frameCache, fileIndex):
+                        if not putChunk(chunkQueue, chunk):
+                            return
+                except Exception as e:
+                    # raised when the consumer reaches this file, connection is not reused
+                    putChunk(chunkQueue, e)
+                    return
+                putChunk(chunkQueue, None)
+        finally:
+            conn.close()
+
+    def readChunks(mtbFile, chunkQueue):
+        while True:
+            with measure("wait for decode", mtbFile.name):
+                item = chunkQueue.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    workerCount = max(1, min(decodeConnections, len(mtbFiles)))
+    workers = [threading.Thread(target=worker, daemon=True) for _ in range(0, workerCount)]
+    for thread in workers:
+        thread.start()
+    try:
+        for fileIdx, mtbFile in enumerate(mtbFiles):
+            yield mtbFile, readChunks(mtbFile, chunkQueues[fileIdx])
+    finally:
+        stopped.set()
+        for thread in workers:
+            thread.join()
+
+def collectFrameSets(chunks):
+    # joins chunks yielded by streamMtbFiles into one array per frame set
+    frameSetChunks = []
+    lastFrameSetIdx = None
+    for frameSetIdx, frames in chunks:
+        if frameSetIdx != lastFrameSetIdx:
+            frameSetChunks.append([])
+            lastFrameSetIdx = frameSetIdx
+        frameSetChunks[-1].append(frames)
+    return [x[0] if len(x) == 1 else np.concatenate(x) for x in frameSetChunks]
+
+def decodeMtbFile(conn, mtbFile: Path, frameParts, frameCache=None, fileIndex=None):
+    # yields (frame set index, frames) chunks of at most streamChunkFrames frames
+    # with frame cache enabled chunks are appended to the cache file of their frame set as they are decoded
+    with measure("read frame set info", mtbFile.name):
+        if fileIndex is not None:
+            mtbFrameSetOffsets, mtbFrameCounts = fileIndex.readFrameSetInfo(mtbFile)
+        else:
+            mtbFrameSetOffsets, mtbFrameCounts = readFrameSetInfo(str(mtbFile.resolve()))
+    mtbHash = None
+    if frameCache is not None:
+        with measure("hash file", mtbFile.name):
+            mtbHash = frameCache.hashFile(mtbFile)
+    fileLoaded = False
+    chunkSize = max(streamChunkFrames, 1)
+    for frameSetIdx in range(0, len(mtbFrameCounts)):
+        framesetDefOffset = mtbFrameSetOffsets[frameSetIdx]
+        frameCount = mtbFrameCounts[frameSetIdx]
+        frameSetEntries = getFrameSetEntries(frameCount, frameParts)
+        if frameCache is not None:
+            with measure("read frame cache", mtbFile.name):
+                cachedFrames = frameCache.getFrames(mtbHash, framesetDefOffset, frameCount, frameSetEntries)
+        else:
+            cachedFrames = [None] * len(frameSetEntries)
+        # opened on the first chunk with missing frames, fully cached frame sets are not rewritten
+        cacheWriter = None
+        try:
+            for chunkStart in range(0, len(frameSetEntries), chunkSize):
+                chunkEntries = frameSetEntries[chunkStart:chunkStart + chunkSize]
+                missingIdx = [idx for idx, frameData in enumerate(cachedFrames[chunkStart:chunkStart + chunkSize])
+                              if frameData is None]
+                if not missingIdx:
+                    frames = stackFrames(cachedFrames[chunkStart:chunkStart + chunkSize])
+                else:
+                    if not fileLoaded:
+                        with measure("load file", mtbFile.name):
+                            remoteLoadFile(conn.get(), mtbFile)
+                        fileLoaded = True
+                    missingEntries = [chunkEntries[idx] for idx in missingIdx]
+                    with measure("decode", mtbFile.name):
+                        frames = decodeFrameSet(conn.get(), framesetDefOffset, frameCount, missingEntries)
+                    if len(missingIdx) < len(chunkEntries):
+                        decodedFrames = frames
+                        frames = np.empty((len(chunkEntries), decodedFrames.shape[1]), dtype='<f4')
+                        frames[missingIdx] = decodedFrames
+                        for idx in range(0, len(chunkEntries)):
+                            if cachedFrames[chunkStart + idx] is not None:
+                                frames[idx] = np.frombuffer(cachedFrames[chunkStart + idx], dtype='<f4')
+                    if frameCache is not None and cacheWriter is None:
+                        with measure("write frame cache", mtbFile.name):
+                            cacheWriter = frameCache.openWriter(mtbHash, framesetDefOffset, frameCount,
+                                                                frameSetEntries, frames.shape[1] * 4)
+                            # earlier chunks were fully cached
+                            cacheWriter.writeFrames(cachedFrames[:chunkStart])
+                if cacheWriter is not None:
+                    with measure("write frame cache", mtbFile.name):
+                        cacheWriter.writeFrames(frames)
+                yield frameSetIdx, frames
+            # views of the old cache file must be released before it is replaced
+            cachedFrames = None
+            if cacheWriter is not None:
+                with measure("write frame cache", mtbFile.name):
+                    cacheWriter.close()
+        finally:
+            if cacheWriter is not None:
+                cacheWriter.abort()
+
+def stackFrames(frameList):
+    # copies separately received frames into a single (frames, frameSize / 4) float array
+    frames = np.empty((len(frameList), len(frameList[0]) // 4), dtype='<f4')
+    for idx, frameData in enumerate(frameList):
+        frames[idx] = np.frombuffer(frameData, dtype='<f4')
+    return frames
+
 def readFrameSetInfo(mtbPath):
-    mtbFrameSetCount = -1
-    mtbFrameSetInfoOffset1 = -1
-    mtbFrameSetInfoOffset2 = -1
-    mtbFrameSetOffsets = []
-    mtbFrameSetFrameCounts = []
-    with open(mtbPath, 'rb') as mtb:
-        stream = LEInputStream(mtb)         
-        stream.seek(0x12)
-        mtbFrameSetCount = stream.readShort()
-        stream.seek(0x38)
-        mtbFrameSetInfoOffset1 = stream.tell() + stream.readInt()
-        stream.seek(0x3C)
-        mtbFrameSetInfoOffset2 = stream.tell() + stream.readInt()
-        stream.seek(mtbFrameSetInfoOffset1)
-        for idx in range(0, mtbFrameSetCount):
-            stream.readInt()
-            mtbFrameSetOffsets.append(stream.readInt())
-        stream.seek(mtbFrameSetInfoOffset2)
-        for idx in range(0, mtbFrameSetCount):
-            stream.readShort()
-            mtbFrameSetFrameCounts.append(stream.readShort())
+    with LEMappedFile(mtbPath) as mtb:
+        mtbFrameSetCount = mtb.readShort(0x12)
+        mtbFrameSetInfoOffset1 = 0x38 + mtb.readInt(0x38)
+        mtbFrameSetInfoOffset2 = 0x3C + mtb.readInt(0x3C)
+        # (unknown int, frame set offset) and (unknown short, frame count) pairs
+        mtbFrameSetOffsets = list(mtb.readInts(mtbFrameSetInfoOffset1, mtbFrameSetCount * 2)[1::2])
+        mtbFrameSetFrameCounts = list(mtb.readShorts(mtbFrameSetInfoOffset2, mtbFrameSetCount * 2)[1::2])
     return mtbFrameSetOffsets, mtbFrameSetFrameCounts
 
 def getFrameParts():
@@ -108,50 +429,198 @@ def getFrameParts():
         cur += inc
     return parts
 
-def readMdlBoneList():
-    boneNames = []
-    with open(mdlPath, 'rb') as mdl:
-        stream = LEInputStream(mdl)
-        stream.seek(0x1C)
-        boneSectOffset = stream.readInt()
-        stream.seek(boneSectOffset + 0x10)
-        boneCount = stream.readInt()
-        stream.seek(boneSectOffset + 0x30)
-        boneNamesHeader = stream.tell() + stream.readInt() + 0x1C
-        stream.seek(boneNamesHeader)
-        boneNamesOffsets = []
-        for idx in range(0, boneCount):
-            boneNamesOffsets.append(stream.tell() + stream.readInt())
-        for idx in range(0, boneCount):
-            stream.seek(boneNamesOffsets[idx])
-            boneNames.append(stream.readString())
+def getFrameSetEntries(frameCount: int, frameParts):
+    if frameCount == 0:
+        return [(0, 0)]
+    entries = []
+    for idx in range(0, frameCount + 1):
+        for part in frameParts:
+            entries.append((idx, part))
+    return entries
+
+def readMdlBoneList(mdlPath):
+    with LEMappedFile(mdlPath) as mdl:
+        boneSectOffset = mdl.readInt(0x1C)
+        boneCount = mdl.readInt(boneSectOffset + 0x10)
+        boneNamesHeader = boneSectOffset + 0x30 + mdl.readInt(boneSectOffset + 0x30) + 0x1C
+        boneNamesOffsets = mdl.readInts(boneNamesHeader, boneCount)
+        boneNames = [mdl.readString(boneNamesHeader + idx * 4 + offset) for idx, offset in enumerate(boneNamesOffsets)]
     return boneNames
 
-def pushLocalFrame(frameData, boneNames, frameIdx: int):
-    if(len(frameData) < 0x30 * len(boneNames)):
-            print("WARN: Too small frame data, dropping frame %d" % frameIdx)
-            return
-    for boneIdx, boneName in enumerate(boneNames):
-        blenderBone = getBlenderBoneByName(boneName)
+def pushLocalFrame(blenderBones, frameIdx: int, locations, scales, rotations):
+    for boneIdx, blenderBone in enumerate(blenderBones):
         if blenderBone is None:
-            print("WARN: Missing bone %s" % boneName)
             continue
-        boneOffset = boneIdx * 0x30
-        qx, qy, qz, qw = unpack_from("<4f", frameData, offset=boneOffset)
-        x, y, z, padding = unpack_from("<4f", frameData, offset=boneOffset+0x10)
-        sx, sy, sz, padding = unpack_from("<4f", frameData, offset=boneOffset+0x20)        
-        sf = 10.0 # scale factor
-        blenderBone.location = [x / sf, y / sf, z / sf]
+        blenderBone.location = locations[boneIdx]
         blenderBone.keyframe_insert(data_path='location', frame=frameIdx)
-        blenderBone.location = [sx / sf, sy / sf, sz / sf]
+        blenderBone.location = scales[boneIdx]
         blenderBone.keyframe_insert(data_path='scale', frame=frameIdx)
-        blenderBone.rotation_quaternion = [qw, qx, qy, qz]
+        blenderBone.rotation_quaternion = rotations[boneIdx]
         blenderBone.keyframe_insert(data_path='rotation_quaternion', frame=frameIdx)
 
-def getBlenderBoneByName(name):
-    for blender_bone in bpy.data.objects[blenderSkeletonTarget].pose.bones.items():
-        if blender_bone[0] == name:
-            return blender_bone[1]
+def unpackFrames(frames, boneCount: int):
+    # frames is a (frames, frameSize / 4) float array, each bone takes 12 floats:
+    # rotation xyzw, translation xyz + padding, scale xyz + padding
+    # returns (frames, bones, 3) locations and scales and (frames, bones, 4) wxyz rotations
+    transforms = frames[:, :boneCount * 12].reshape(len(frames), boneCount, 12)
+    sf = 10.0 # scale factor
+    locations = transforms[:, :, 4:7] / sf
+    scales = transforms[:, :, 8:11] / sf
+    rotations = transforms[:, :, [3, 0, 1, 2]]
+    return locations, scales, rotations
+
+class KeyframeBuffer:
+    # Collects unpacked frames and writes them into F-curves in one pass.
+    # Produces the same keys as pushLocalFrame, including scale keys which keep the current pose bone scale.
+    # Keys are reduced as chunks of frames are added, so only kept keys stay buffered until commit.
+    # First and last frame of each chunk are always kept.
+    def __init__(self, blenderBones):
+        self.blenderBones = blenderBones
+        self.frames = []
+        self.scaleFrames = []
+        self.locationKeys = [[] for _ in blenderBones]
+        self.rotationKeys = [[] for _ in blenderBones]
+
+    def addFrames(self, firstFrameIdx: int, locations, rotations):
+        frames = np.arange(firstFrameIdx, firstFrameIdx + len(locations), dtype=np.float32)
+        self.frames.append(frames)
+        # scale keys hold the constant pose bone scale, reduction leaves only the chunk endpoints
+        self.scaleFrames.append(np.unique(frames[[0, -1]]) if reduceKeyframes else frames)
+        for boneIdx, blenderBone in enumerate(self.blenderBones):
+            if blenderBone is None:
+                continue
+            for keys, values, tolerance, errorFunc in (
+                    (self.locationKeys[boneIdx], locations[:, boneIdx], locationTolerance, vectorError),
+                    (self.rotationKeys[boneIdx], rotations[:, boneIdx], rotationTolerance, rotationError)):
+                keyIdx = reduceKeys(frames, values, tolerance, errorFunc) if reduceKeyframes else slice(None)
+                # copied so buffered keys don't keep whole unpacked chunks alive
+                keys.append((frames[keyIdx], np.ascontiguousarray(values[keyIdx])))
+
+    def commit(self, obj):
+        if len(self.frames) == 0:
+            return
+        frames = np.concatenate(self.frames)
+        scaleFrames = np.concatenate(self.scaleFrames)
+        animData = obj.animation_data_create()
+        if animData.action is None:
+            animData.action = bpy.data.actions.new(obj.name + "Action")
+        action = animData.action
+        keyCount = 0
+        for boneIdx, blenderBone in enumerate(self.blenderBones):
+            if blenderBone is None:
+                continue
+            scales = np.tile(np.array(blenderBone.scale, dtype=np.float32), (len(scaleFrames), 1))
+            for prop, keyFrames, values in (
+                    ('location',) + self.joinKeys(self.locationKeys[boneIdx]),
+                    ('scale', scaleFrames, scales),
+                    ('rotation_quaternion',) + self.joinKeys(self.rotationKeys[boneIdx])):
+                self.writeFCurves(action, blenderBone, prop, keyFrames, values, frames)
+                keyCount += len(keyFrames)
+        if reduceKeyframes:
+            boneCount = len(self.blenderBones) - self.blenderBones.count(None)
+            print("Keyframe reduction: kept %d of %d keys" % (keyCount, boneCount * len(frames) * 3))
+
+    def joinKeys(self, keys):
+        return np.concatenate([x[0] for x in keys]), np.concatenate([x[1] for x in keys])
+
+    def writeFCurves(self, action, blenderBone, prop, frames, values, replacedFrames):
+        # existing keys on replacedFrames are removed, including frames dropped by keyframe reduction
+        dataPath = blenderBone.path_from_id(prop)
+        for index in range(0, values.shape[1]):
+            co = np.empty((len(frames), 2), dtype=np.float32)
+            co[:, 0] = frames
+            co[:, 1] = values[:, index]
+            fcurve = action.fcurves.find(dataPath, index=index)
+            if fcurve is not None:
+                # merge with existing keys, new keys replace old ones on the same frame
+                existingCo = np.empty(2 * len(fcurve.keyframe_points), dtype=np.float32)
+                fcurve.keyframe_points.foreach_get("co", existingCo)
+                existingCo = existingCo.reshape(-1, 2)
+                existingCo = existingCo[~np.isin(existingCo[:, 0], replacedFrames)]
+                co = np.concatenate((existingCo, co))
+                co = co[np.argsort(co[:, 0], kind='stable')]
+                action.fcurves.remove(fcurve)
+            fcurve = action.fcurves.new(dataPath, index=index, action_group=blenderBone.name)
+            fcurve.keyframe_points.add(len(co))
+            fcurve.keyframe_points.foreach_set("co", co.ravel())
+            if reduceKeyframes:
+                for keyframePoint in fcurve.keyframe_points:
+                    keyframePoint.interpolation = 'LINEAR'
+            fcurve.update()
+
+def reduceKeys(frames, values, tolerance: float, errorFunc):
+    # returns indexes of keys needed to reproduce values within tolerance by interpolating between kept keys
+    # first and last keys are always kept, segments are split at their largest error until all fit
+    count = len(frames)
+    if count <= 2:
+        return np.arange(count)
+    keep = np.zeros(count, dtype=bool)
+    keep[0] = keep[-1] = True
+    segments = [(0, count - 1)]
+    while segments:
+        start, end = segments.pop()
+        if end - start < 2:
+            continue
+        t = (frames[start + 1:end] - frames[start]) / (frames[end] - frames[start])
+        errors = errorFunc(values[start], values[end], t[:, None], values[start + 1:end])
+        worstIdx = int(np.argmax(errors))
+        if errors[worstIdx] <= tolerance:
+            continue
+        splitIdx = start + 1 + worstIdx
+        keep[splitIdx] = True
+        segments.append((start, splitIdx))
+        segments.append((splitIdx, end))
+    return np.flatnonzero(keep)
+
+def vectorError(startValue, endValue, t, values):
+    return np.linalg.norm(startValue + (endValue - startValue) * t - values, axis=1)
+
+def rotationError(startValue, endValue, t, values):
+    # Blender interpolates quaternion F-curves per component and normalizes the result,
+    # error is the angle between that and the decoded rotation
+    # computed in float64, float32 can't resolve angles below about 7e-4 radians
+    startValue = np.asarray(startValue, dtype=np.float64)
+    endValue = np.asarray(endValue, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    interpolated = startValue + (endValue - startValue) * np.asarray(t, dtype=np.float64)
+    interpolated /= np.maximum(np.linalg.norm(interpolated, axis=1), 1e-12)[:, None]
+    values = values / np.maximum(np.linalg.norm(values, axis=1), 1e-12)[:, None]
+    # q and -q are the same rotation, half angle from chord lengths stays accurate for small angles unlike arccos
+    values[np.sum(interpolated * values, axis=1) < 0.0] *= -1.0
+    return 4.0 * np.arctan2(np.linalg.norm(interpolated - values, axis=1),
+                            np.linalg.norm(interpolated + values, axis=1))
+
+def getBlenderBoneMap(boneNames):
+    # maps MDL bone index to Blender pose bone, None for bones missing in the skeleton
+    poseBones = dict(bpy.data.objects[blenderSkeletonTarget].pose.bones.items())
+    blenderBones = []
+    for boneName in boneNames:
+        blenderBone = poseBones.get(boneName)
+        if blenderBone is None:
+            print("WARN: Missing bone %s" % boneName)
+        blenderBones.append(blenderBone)
+    return blenderBones
+
+def connectAnimserv():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.connect(animservAddress)
+    return sock
+
+class AnimservConnection:
+    # connects on first use so fully cached imports do not need animserv
+    def __init__(self):
+        self.sock = None
+
+    def get(self):
+        if self.sock is None:
+            self.sock = connectAnimserv()
+        return self.sock
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
 
 def remoteLoadFile(sock, path: Path):
     pathBytes = str(path.resolve()).replace("/", "\\").encode("utf-16le")
@@ -165,48 +634,418 @@ def remoteLoadFile(sock, path: Path):
         raise ValueError("Invalid response after loading file")
 
 def remoteDecodeFrame(sock, framesetDefOffset: int, frameIdx: int, frameCount: int, framePart: float):
+    sendDecodeFrameRequest(sock, framesetDefOffset, frameIdx, frameCount, framePart)
+    return recvDecodeFrameResponse(sock)
+
+def remoteDecodeFramesPipelined(sock, framesetDefOffset: int, frameCount: int, entries, window: int):
+    # server handles requests of a single connection in order so responses are matched by position
+    # all frames are received directly into rows of a single (frames, frameSize / 4) float array
+    frames = None
+    headerBuffer = bytearray(8)
+    sentCount = 0
+    for receivedCount in range(0, len(entries)):
+        while sentCount < len(entries) and sentCount - receivedCount < max(window, 1):
+            frameIdx, framePart = entries[sentCount]
+            sendDecodeFrameRequest(sock, framesetDefOffset, frameIdx, frameCount, framePart)
+            sentCount += 1
+        dataSize = recvDecodeFrameHeader(sock, headerBuffer)
+        if frames is None:
+            frames = np.empty((len(entries), dataSize // 4), dtype='<f4')
+        if not dataSize == frames.shape[1] * 4:
+            raise ValueError("Inconsistent decoded frame size")
+        recvall(sock, dataSize, frames[receivedCount])
+    return frames
+
+def sendDecodeFrameRequest(sock, framesetDefOffset: int, frameIdx: int, frameCount: int, framePart: float):
     sock.sendall(pack("<h3if", 0x3332, framesetDefOffset, frameCount, frameIdx, framePart))
-    resId, resError, dataSize = unpack("<2hi", recvall(sock, 8))
-    if not resId == 0x3333 or not resError == 0:
-        raise ValueError("Invalid response after decoding frame")
+
+def recvDecodeFrameResponse(sock):
+    dataSize = recvDecodeFrameHeader(sock)
     decodedData = recvall(sock, dataSize)
     return decodedData
 
-def recvall(sock, n):
-    data = b''
-    while len(data) < n:
-        packet = sock.recv(n - len(data))
-        if not packet:
-            return None
-        data += packet
-    return data
+def recvDecodeFrameHeader(sock, headerBuffer=None):
+    resId, resError, dataSize = unpack("<2hi", recvall(sock, 8, headerBuffer))
+    if not resId == 0x3333 or not resError == 0:
+        raise ValueError("Invalid response after decoding frame")
+    return dataSize
 
-class LEInputStream:
-    def __init__(self, stream):
-        self.stream = stream
+def decodeFrameSet(sock, framesetDefOffset: int, frameCount: int, entries):
+    # returns decoded frames as a (frames, frameSize / 4) float array
+    if not useBatchedDecode:
+        return remoteDecodeFramesPipelined(sock, framesetDefOffset, frameCount, entries, decodePipelineWindow)
+    decodedBatches = []
+    for batchStart in range(0, len(entries), maxBatchEntries):
+        batch = entries[batchStart:batchStart + maxBatchEntries]
+        decodedBatches.append(remoteDecodeFrameBatch(sock, framesetDefOffset, frameCount, batch))
+    if len(decodedBatches) == 1:
+        return decodedBatches[0]
+    return np.concatenate(decodedBatches)
 
-    def readByte(self):
-        return unpack('b', self.stream.read(1))[0]
+def remoteDecodeFrameBatch(sock, framesetDefOffset: int, frameCount: int, entries):
+    request = bytearray(pack("<h3i", 0x3334, framesetDefOffset, frameCount, len(entries)))
+    for frameIdx, framePart in entries:
+        request += pack("<if", frameIdx, framePart)
+    sock.sendall(request)
+    resId, resError, entryCount, frameSize = unpack("<2h2i", recvall(sock, 12))
+    if resId == 0x3335 and resError == 5 and len(entries) > 1:
+        # too much decoded data for a single response, the connection is still usable
+        half = len(entries) // 2
+        return np.concatenate((remoteDecodeFrameBatch(sock, framesetDefOffset, frameCount, entries[:half]),
+                               remoteDecodeFrameBatch(sock, framesetDefOffset, frameCount, entries[half:])))
+    if not resId == 0x3335 or not resError == 0 or not entryCount == len(entries):
+        raise ValueError("Invalid response after decoding frame batch")
+    frames = np.empty((entryCount, frameSize // 4), dtype='<f4')
+    recvall(sock, entryCount * frameSize, frames)
+    return frames
 
-    def readShort(self):
-        return unpack('<h', self.stream.read(2))[0]
+def recvall(sock, n, buffer=None):
+    # receives exactly n bytes into buffer, or a newly allocated one when not given
+    # buffer can be anything writable supporting buffer protocol, returns a view of received bytes
+    if buffer is None:
+        buffer = bytearray(n)
+    view = memoryview(buffer).cast('B')[:n]
+    received = 0
+    while received < n:
+        count = sock.recv_into(view[received:], n - received)
+        if count == 0:
+            raise ConnectionError("Connection closed by animserv")
+        received += count
+    return view
 
-    def readInt(self):
-        return unpack('<i', self.stream.read(4))[0]
-    
-    def readString(self):
-        data = bytearray()
-        while True:
-            byte = self.readByte()
-            if byte == 0:
+class FrameCache:
+    # One file per (mtb hash, frameset offset, frame count) laid out as:
+    # header: magic, entry count, frame size
+    # entries: entryCount * (frameIdx, framePart)
+    # data: entryCount * frameSize decoded frame data
+    # Returned frames are views into memory mapped cache files
+    magic = b"MTFC"
+    headerFormat = Struct("<4s2i")
+    entryFormat = Struct("<if")
+
+    def __init__(self, cacheDir: Path, maxSize: int):
+        self.cacheDir = cacheDir
+        self.maxSize = maxSize
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.cacheDir.mkdir(parents=True, exist_ok=True)
+        self.totalSize = sum(x.stat().st_size for x in self.cacheDir.glob("*.mtfc"))
+
+    def hashFile(self, path: Path):
+        sha = hashlib.sha1()
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(0x100000), b''):
+                sha.update(chunk)
+        return sha.hexdigest()
+
+    def getFrames(self, mtbHash, framesetDefOffset: int, frameCount: int, entries):
+        frames = [None] * len(entries)
+        cacheFile = self.getCacheFile(mtbHash, framesetDefOffset, frameCount)
+        cachedFrames = self.readCacheFile(cacheFile)
+        if cachedFrames:
+            for idx, entry in enumerate(entries):
+                frames[idx] = cachedFrames.get(self.entryFormat.pack(*entry))
+        hitCount = len(entries) - frames.count(None)
+        cachedFrames = None
+        if hitCount > 0:
+            try:
+                os.utime(cacheFile)
+            except OSError:
+                pass
+        with self.lock:
+            self.hits += hitCount
+            self.misses += len(entries) - hitCount
+        return frames
+
+    def openWriter(self, mtbHash, framesetDefOffset: int, frameCount: int, entries, frameSize: int):
+        return FrameCacheWriter(self, self.getCacheFile(mtbHash, framesetDefOffset, frameCount), entries, frameSize)
+
+    def addFile(self, cacheFile: Path, tmpFile: Path):
+        newSize = tmpFile.stat().st_size
+        oldSize = cacheFile.stat().st_size if cacheFile.exists() else 0
+        try:
+            os.replace(tmpFile, cacheFile)
+        except OSError:
+            # cache file is still mapped by someone else
+            tmpFile.unlink()
+            return
+        with self.lock:
+            self.totalSize += newSize - oldSize
+            if self.totalSize > self.maxSize:
+                self.evict()
+
+    def getCacheFile(self, mtbHash, framesetDefOffset: int, frameCount: int):
+        return self.cacheDir / ("%s_%x_%d.mtfc" % (mtbHash, framesetDefOffset, frameCount))
+
+    def readCacheFile(self, cacheFile: Path):
+        try:
+            with open(cacheFile, 'rb') as file:
+                data = memoryview(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+        except (OSError, ValueError):
+            return None
+        if len(data) < self.headerFormat.size:
+            return None
+        magic, entryCount, frameSize = self.headerFormat.unpack_from(data, 0)
+        entriesStart = self.headerFormat.size
+        dataStart = entriesStart + entryCount * self.entryFormat.size
+        if magic != self.magic or len(data) != dataStart + entryCount * frameSize:
+            return None
+        cachedFrames = {}
+        for idx in range(0, entryCount):
+            entryStart = entriesStart + idx * self.entryFormat.size
+            frameStart = dataStart + idx * frameSize
+            entryKey = bytes(data[entryStart:entryStart + self.entryFormat.size])
+            cachedFrames[entryKey] = data[frameStart:frameStart + frameSize]
+        return cachedFrames
+
+    def evict(self):
+        cacheFiles = []
+        for cacheFile in self.cacheDir.glob("*.mtfc"):
+            stat = cacheFile.stat()
+            cacheFiles.append((stat.st_mtime, stat.st_size, cacheFile))
+        cacheFiles.sort(key=lambda x: x[0])
+        self.totalSize = sum(x[1] for x in cacheFiles)
+        for mtime, size, cacheFile in cacheFiles:
+            if self.totalSize <= self.maxSize:
                 break
-            data.append(byte)
-        return data.decode("ascii")
-    
-    def tell(self):
-        return self.stream.tell()
-    
-    def seek(self, offset, whence=0):
-        self.stream.seek(offset, whence)
-
-importMtb()
+            try:
+                cacheFile.unlink()
+            except OSError:
+                # still mapped
+                continue
+            self.totalSize -= size
+
+class FrameCacheWriter:
+    # Writes a frame set cache file while its frames are being decoded, frames must be written in entry order
+    # Entries of the old cache file which are not part of the frame set are kept, those are copied from
+    # the old file when the writer is closed so they don't have to be held in memory
+    def __init__(self, frameCache: FrameCache, cacheFile: Path, entries, frameSize: int):
+        self.frameCache = frameCache
+        self.cacheFile = cacheFile
+        self.frameSize = frameSize
+        self.entryCount = len(entries)
+        self.writtenCount = 0
+        entryKeys = [FrameCache.entryFormat.pack(*entry) for entry in entries]
+        # keep entries cached for other framePartDiv values
+        self.keptFrames = frameCache.readCacheFile(cacheFile) or {}
+        for entryKey in entryKeys:
+            self.keptFrames.pop(entryKey, None)
+        if any(len(frameData) != frameSize for frameData in self.keptFrames.values()):
+            self.keptFrames = {}
+        self.tmpFile = cacheFile.with_name(cacheFile.name + ".%d.tmp" % threading.get_ident())
+        self.file = open(self.tmpFile, 'wb')
+        self.file.write(FrameCache.headerFormat.pack(FrameCache.magic, len(entryKeys) + len(self.keptFrames),
+                                                     frameSize))
+        self.file.write(b''.join(entryKeys))
+        self.file.write(b''.join(self.keptFrames.keys()))
+
+    def writeFrames(self, frames):
+        # frames is a (frames, frameSize / 4) float array or a list of frame buffers
+        if isinstance(frames, np.ndarray):
+            if frames.shape[1] * frames.itemsize != self.frameSize:
+                raise ValueError("Frame size changed while writing frame cache")
+            self.file.write(np.ascontiguousarray(frames, dtype='<f4'))
+        else:
+            for frameData in frames:
+                if memoryview(frameData).nbytes != self.frameSize:
+                    raise ValueError("Frame size changed while writing frame cache")
+                self.file.write(frameData)
+        self.writtenCount += len(frames)
+
+    def close(self):
+        if self.writtenCount != self.entryCount:
+            raise ValueError("Frame cache file is missing frames")
+        for frameData in self.keptFrames.values():
+            self.file.write(frameData)
+        self.keptFrames = None
+        self.file.close()
+        self.file = None
+        self.frameCache.addFile(self.cacheFile, self.tmpFile)
+
+    def abort(self):
+        # removes unfinished file, does nothing after close
+        if self.file is None:
+            return
+        self.keptFrames = None
+        self.file.close()
+        self.file = None
+        try:
+            self.tmpFile.unlink()
+        except OSError:
+            pass
+
+def measure(stage: str, fileName=None):
+    # times a with block as stage of current import, does nothing when profiling is disabled
+    if profiler is None:
+        return contextlib.nullcontext()
+    return profiler.measure(stage, fileName)
+
+class Profiler:
+    # Thread safe collection of stage timings, every sample is kept to compute percentiles
+    # Stages measured on decode worker threads overlap with stages measured in Blender,
+    # so the sum of all stages can be larger than the wall clock time
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start = time.perf_counter()
+        self.samples = {}
+        self.fileSamples = {}
+
+    @contextlib.contextmanager
+    def measure(self, stage: str, fileName=None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start, fileName)
+
+    def record(self, stage: str, elapsed: float, fileName=None):
+        with self.lock:
+            self.samples.setdefault(stage, []).append(elapsed)
+            if fileName is not None:
+                fileStages = self.fileSamples.setdefault(fileName, {})
+                fileStages[stage] = fileStages.get(stage, 0.0) + elapsed
+
+    def getStageStats(self, samples):
+        samples = np.array(samples)
+        return {"count": len(samples), "total": float(samples.sum()), "p50": float(np.percentile(samples, 50)),
+                "p95": float(np.percentile(samples, 95)), "max": float(samples.max())}
+
+    def getReport(self):
+        # times are in seconds, per file totals only include stages which know the file they work on
+        with self.lock:
+            return {"wallTime": time.perf_counter() - self.start,
+                    "stages": {stage: self.getStageStats(samples) for stage, samples in self.samples.items()},
+                    "files": {fileName: dict(stages) for fileName, stages in self.fileSamples.items()}}
+
+    def printReport(self, report):
+        print("%-20s %8s %12s %10s %10s %10s" % ("stage", "count", "total [ms]", "p50 [ms]", "p95 [ms]", "max [ms]"))
+        for stage, stats in sorted(report["stages"].items(), key=lambda x: -x[1]["total"]):
+            print("%-20s %8d %12.2f %10.3f %10.3f %10.3f" % (stage, stats["count"], stats["total"] * 1000.0,
+                  stats["p50"] * 1000.0, stats["p95"] * 1000.0, stats["max"] * 1000.0))
+        print("wall time: %.2f ms" % (report["wallTime"] * 1000.0))
+        fileTotals = sorted(((sum(stages.values()), fileName) for fileName, stages in report["files"].items()), reverse=True)
+        if fileTotals:
+            print("slowest files:")
+            for total, fileName in fileTotals[:10]:
+                print("  %-32s %10.2f ms" % (fileName, total * 1000.0))
+
+class FileIndex:
+    # Persistent per directory index of .mtb frame set tables and .mdl bone lists
+    # Entries are keyed by file name and reused while file size and mtime stay the same
+    # Directory listing is done once with scandir so unchanged files are never opened
+    fileName = ".mtb_index.json"
+    version = 1
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.dirs = {}
+
+    def listFiles(self, dirPath: Path, suffix: str):
+        with self.lock:
+            dirIndex = self.getDirIndex(Path(dirPath).resolve())
+            names = sorted(name for name in dirIndex["stats"].keys() if name.endswith(suffix))
+        return [Path(dirPath) / name for name in names]
+
+    def readFrameSetInfo(self, mtbFile):
+        def readEntry(path):
+            mtbFrameSetOffsets, mtbFrameCounts = readFrameSetInfo(str(path))
+            return {"frameSetOffsets": mtbFrameSetOffsets, "frameCounts": mtbFrameCounts}
+        entry = self.getEntry(Path(mtbFile), "mtb", readEntry)
+        return entry["frameSetOffsets"], entry["frameCounts"]
+
+    def readMdlBoneList(self, mdlFile):
+        return self.getEntry(Path(mdlFile), "mdl", lambda path: {"boneNames": readMdlBoneList(str(path))})["boneNames"]
+
+    def getEntry(self, path: Path, kind: str, readEntry):
+        path = path.resolve()
+        with self.lock:
+            dirIndex = self.getDirIndex(path.parent)
+            stat = dirIndex["stats"].get(path.name)
+            if stat is None:
+                stat = path.stat()
+            entry = dirIndex["entries"][kind].get(path.name)
+            if entry is not None and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime_ns:
+                return entry
+        entry = readEntry(path)
+        entry["size"] = stat.st_size
+        entry["mtime"] = stat.st_mtime_ns
+        with self.lock:
+            dirIndex["entries"][kind][path.name] = entry
+            dirIndex["dirty"] = True
+        return entry
+
+    def getDirIndex(self, dirPath: Path):
+        dirIndex = self.dirs.get(dirPath)
+        if dirIndex is not None:
+            return dirIndex
+        entries = {"mtb": {}, "mdl": {}}
+        try:
+            with open(dirPath / self.fileName, 'r') as file:
+                data = json.load(file)
+            if data.get("version") == self.version:
+                entries = data["entries"]
+        except (OSError, ValueError, KeyError):
+            pass
+        stats = {}
+        with os.scandir(dirPath) as listing:
+            for dirEntry in listing:
+                if dirEntry.name.endswith((".mtb", ".mdl")) and dirEntry.is_file():
+                    stats[dirEntry.name] = dirEntry.stat()
+        dirIndex = {"entries": entries, "stats": stats, "dirty": False}
+        self.dirs[dirPath] = dirIndex
+        return dirIndex
+
+    def save(self):
+        with self.lock:
+            for dirPath, dirIndex in self.dirs.items():
+                if not dirIndex["dirty"]:
+                    continue
+                for entries in dirIndex["entries"].values():
+                    for name in [name for name in entries.keys() if name not in dirIndex["stats"]]:
+                        del entries[name]
+                indexFile = dirPath / self.fileName
+                tmpFile = dirPath / (self.fileName + ".tmp")
+                try:
+                    with open(tmpFile, 'w') as file:
+                        json.dump({"version": self.version, "entries": dirIndex["entries"]}, file)
+                    os.replace(tmpFile, indexFile)
+                    dirIndex["dirty"] = False
+                except OSError as e:
+                    print("WARN: Can't write file index %s: %s" % (indexFile, e))
+
+class LEMappedFile:
+    # little endian reader over a read only memory mapped file, all reads take absolute offsets
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.data.close()
+
+    def readShort(self, offset: int):
+        return unpack_from('<h', self.data, offset)[0]
+
+    def readInt(self, offset: int):
+        return unpack_from('<i', self.data, offset)[0]
+
+    def readShorts(self, offset: int, count: int):
+        return unpack_from('<%dh' % count, self.data, offset)
+
+    def readInts(self, offset: int, count: int):
+        return unpack_from('<%di' % count, self.data, offset)
+
+    def readString(self, offset: int):
+        end = self.data.find(b'\0', offset)
+        if end == -1:
+            raise ValueError("Unterminated string at offset 0x%x" % offset)
+        return self.data[offset:end].decode("ascii")
+
+if __name__ == "__main__":
+    importMtb()
@@ -0,0 +1,72 @@
+# Tests of import_mtb.py parts which don't need Blender or animserv
+
+# Usage: python -m unittest test_import_mtb.py
+
+from pathlib import Path
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+import import_mtb
+
+def makeRotationCurve(frameCount: int, seed: int):
+    # smooth float32 wxyz curve with small noise, same dtype as unpackFrames output
+    rng = np.random.default_rng(seed)
+    t = np.arange(frameCount, dtype=np.float64)[:, None]
+    phases = rng.uniform(0.0, 2.0 * np.pi, 4)
+    rates = rng.uniform(0.002, 0.02, 4)
+    rotations = np.sin(t * rates + phases) + rng.normal(0.0, 2e-4, (frameCount, 4))
+    rotations /= np.linalg.norm(rotations, axis=1)[:, None]
+    return rotations.astype(np.float32)
+
+def interpolatedAngleErrors(frames, rotations, keyIdx):
+    # reference error in float64: per component linear interpolation between kept keys, normalized,
+    # rotation angle from the chord between quaternions in the same hemisphere
+    keyFrames = frames[keyIdx].astype(np.float64)
+    values = rotations.astype(np.float64)
+    interpolated = np.stack([np.interp(frames.astype(np.float64), keyFrames, values[keyIdx, c]) for c in range(4)],
+                            axis=1)
+    interpolated /= np.linalg.norm(interpolated, axis=1)[:, None]
+    values /= np.linalg.norm(values, axis=1)[:, None]
+    values *= np.where(np.sum(interpolated * values, axis=1) < 0.0, -1.0, 1.0)[:, None]
+    return 4.0 * np.arcsin(np.minimum(np.linalg.norm(interpolated - values, axis=1) / 2.0, 1.0))
+
+class RotationErrorTest(unittest.TestCase):
+    def testSmallAnglesAreResolved(self):
+        # quaternion rotated by known angles around z, including angles float32 arccos can't resolve
+        start = np.array([1.0, 0.0, 0.0, 0.0], dtype=np.float32)
+        for angle in (1e-4, 3e-4, 5e-4, 8e-4, 0.1):
+            value = np.array([[np.cos(angle / 2.0), 0.0, 0.0, np.sin(angle / 2.0)]], dtype=np.float32)
+            error = import_mtb.rotationError(start, start, np.zeros((1, 1), dtype=np.float32), value)
+            self.assertAlmostEqual(error[0], angle, delta=angle * 1e-3)
+
+    def testOppositeHemisphere(self):
+        start = np.array([1.0, 0.0, 0.0, 0.0], dtype=np.float32)
+        value = np.array([[-np.cos(1e-4), 0.0, 0.0, -np.sin(1e-4)]], dtype=np.float32)
+        error = import_mtb.rotationError(start, start, np.zeros((1, 1), dtype=np.float32), value)
+        self.assertAlmostEqual(error[0], 2e-4, delta=1e-6)
+
+class ReduceKeysTest(unittest.TestCase):
+    def testReducedRotationCurveWithinTolerance(self):
+        tolerance = import_mtb.rotationTolerance
+        for seed in range(8):
+            rotations = makeRotationCurve(1500, seed)
+            frames = np.arange(len(rotations), dtype=np.float32)
+            keyIdx = import_mtb.reduceKeys(frames, rotations, tolerance, import_mtb.rotationError)
+            self.assertLess(len(keyIdx), len(frames))
+            errors = interpolatedAngleErrors(frames, rotations, keyIdx)
+            self.assertLessEqual(errors.max(), tolerance * (1.0 + 1e-6))
+
+    def testReducedLocationCurveWithinTolerance(self):
+        rng = np.random.default_rng(1)
+        frames = np.arange(1000, dtype=np.float32)
+        locations = np.cumsum(rng.normal(0.0, 1e-3, (len(frames), 3)), axis=0).astype(np.float32)
+        keyIdx = import_mtb.reduceKeys(frames, locations, import_mtb.locationTolerance, import_mtb.vectorError)
+        interpolated = np.stack([np.interp(frames, frames[keyIdx], locations[keyIdx, c]) for c in range(3)], axis=1)
+        errors = np.linalg.norm(interpolated.astype(np.float64) - locations, axis=1)
+        self.assertLessEqual(errors.max(), import_mtb.locationTolerance * (1.0 + 1e-3))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,285 @@
+# Benchmark for the model load path of data_fate_extella.py
+
+# Runs outside of Noesis with noesis_stub.py standing in for noesis, rapi and inc_noesis.
+# Synthetic .mdl files for each platform are generated unless --mdl points to real files or
+# directories with them. --digest prints a hash of recorded Noesis calls of each file, which
+# can be compared between versions of the plugin.
+
+# Usage: python bench_fate_extella.py [--files 8] [--platform DX11] [--meshes 20] [--verts 2000] [--bones 150]
+#        python bench_fate_extella.py --mdl resource/target/win [--repeat 3] [--metadata] [--digest] [--profile]
+
+from struct import pack, pack_into
+from pathlib import Path
+import argparse
+import cProfile
+import pstats
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+import noesis_stub
+
+noesis_stub.install()
+import rapi
+import data_fate_extella
+
+# platform name written to GPR, Extella Link mode, vertex strides used by synthetic meshes
+syntheticPlatforms = {
+    "DX11": ("DX11", False, [44, 40, 36, 28]),
+    "NX": ("NX", False, [44, 40, 32, 24]),
+    "GXM": ("GXM", False, [24, 28, 19]),
+    "GXM-Link": ("GXM", True, [31, 35, 24]),
+}
+
+textureExtensions = {"DX11": ".dds", "NX": ".bntx", "GXM": ".gxt"}
+
+
+class ChunkWriter:
+    # builds MESH section chunks, name + size + data
+    def __init__(self):
+        self.data = bytearray()
+
+    def chunk(self, name, data):
+        self.data += name.encode("ascii") + pack("<i", len(data)) + data
+
+
+def writeSyntheticMdl(path, platform, meshCount, vertCount, boneCount, seed=0):
+    # writes .mdl with all sections read by the plugin and returns texture names it references
+    gprPlatform, extellaLinkMode, strides = syntheticPlatforms[platform]
+    rng = random.Random(seed)
+    materialCount = max(1, meshCount // 4)
+
+    strings = []
+
+    def sid(string):
+        strings.append(string)
+        return len(strings) - 1
+
+    meshNameSids = [sid("mesh_{:03d}".format(meshIdx)) for meshIdx in range(meshCount)]
+    materialNameSids = [sid("material_{:03d}".format(matIdx)) for matIdx in range(materialCount)]
+    textureNames = ["tex_{:03d}".format(matIdx) for matIdx in range(materialCount)]
+    textureSids = [sid("textures/" + name + ".tga") for name in textureNames]
+    albedoSid = sid("Albedo0" if not extellaLinkMode else "DiffuseMap")
+    normalSid = sid("Normal0" if not extellaLinkMode else "NormalMap")
+    boneNameSids = [sid("bone_{:03d}".format(boneIdx)) for boneIdx in range(boneCount)]
+
+    version = "Collada Mesh File Version 1.009" if extellaLinkMode else "Collada Mesh File Version 1.007"
+    mesh = ChunkWriter()
+    mesh.chunk("COLL", version.encode("ascii").ljust(0x20, b"\0"))
+    mesh.chunk("STRB", pack("<i4si", len(strings), b"STRL", 0) + b"".join(s.encode("ascii") + b"\0" for s in strings))
+    for matIdx in range(materialCount):
+        sstv = ChunkWriter()
+        sstv.chunk("SSTV", pack("<3i", albedoSid, textureSids[matIdx], textureSids[matIdx]))
+        sstv.chunk("SSTV", pack("<3i", normalSid, textureSids[matIdx], textureSids[matIdx]))
+        mesh.chunk("SAMP", pack("<i", matIdx) + sstv.data)
+    for matIdx in range(materialCount):
+        mesh.chunk("MATE", pack("<8i", matIdx, materialNameSids[matIdx], materialNameSids[matIdx], 0, 0, 0, 0, matIdx))
+    prims = ChunkWriter()
+    for meshIdx in range(meshCount):
+        prims.chunk("PRIM", pack("<7i", meshIdx, meshNameSids[meshIdx], meshNameSids[meshIdx], 0,
+                                 meshNameSids[meshIdx], meshIdx % materialCount, 0))
+    mesh.chunk("VARI", pack("<4i", 0, 0, 0, 0) + prims.data)
+    if boneCount > 0:
+        boif = ChunkWriter()
+        for boneIdx in range(boneCount):
+            boif.chunk("BOIF", pack("<2i", boneNameSids[boneIdx], boneIdx))
+        mesh.chunk("BONE", pack("<i", boneCount) + boif.data)
+    meshSect = b"MESH" + pack("<i", len(mesh.data)) + mesh.data
+
+    # GPR near data has VXST and VXBF headers, far data has vertices and indexes
+    vxstCountOffset = 0x10 if gprPlatform == "GXM" else 0x18
+    layoutPlatform = "GXM" if gprPlatform == "GXM" else "DX11"
+    near = bytearray()
+    far = bytearray()
+    descriptors = []
+    meshBoneCount = min(boneCount, 64)
+    for meshIdx in range(meshCount):
+        stride = strides[meshIdx % len(strides)]
+        layout = data_fate_extella.fate.vertexLayouts[(layoutPlatform, extellaLinkMode, stride)]
+        vertData = bytearray(rng.getrandbits(vertCount * stride * 8).to_bytes(vertCount * stride, "little"))
+        if layout.boneOffset is not None and meshBoneCount > 0:
+            for vertIdx in range(vertCount):
+                for byteIdx in range(4):
+                    vertData[vertIdx * stride + layout.boneOffset + byteIdx] = rng.randrange(meshBoneCount)
+        if gprPlatform == "GXM":
+            indexes = [rng.randrange(vertCount) for _ in range(vertCount // 2 * 3)]
+        else:
+            indexes = []
+            while len(indexes) < vertCount * 2:
+                if len(indexes) > 0:
+                    indexes.append(0xFFFF)
+                indexes += [rng.randrange(vertCount) for _ in range(rng.randint(3, 24))]
+        indexData = pack("<{}H".format(len(indexes)), *indexes)
+
+        descriptors.append(("VXST", len(near), 0x20, 0, 0))
+        near += bytes(vxstCountOffset) + pack("<i", len(indexes)) + bytes(0x1C - vxstCountOffset)
+        descriptors.append(("VXBF", len(near), 0x10, len(far), len(vertData)))
+        near += pack("<4i", 0, 0, vertCount, stride)
+        far += vertData
+        far += bytes(-len(far) % 0x10)
+        descriptors.append(("IXBF", 0, 0, len(far), len(indexData)))
+        far += indexData
+        far += bytes(-len(far) % 0x10)
+
+    heapSize = 0x10
+    gpr = bytearray(0x60)
+    gpr[0:4] = b"GPR\0"
+    gpr[8:12] = gprPlatform.encode("ascii").ljust(4, b"\0")
+    gpr[0x40:0x44] = b"HEAP"
+    pack_into("<7i", gpr, 0x44, 0, 0, 0x20, 0, heapSize, 0, len(descriptors))
+    for name, offset, size, farOffset, farSize in descriptors:
+        gpr += name.encode("ascii") + pack("<7i", 0, 0, offset, size, farOffset, farSize, 0)
+    gpr += bytes(heapSize)
+    gpr += "SYNTH_{}".format(platform).encode("ascii") + b"\0"
+    gpr += bytes(-len(gpr) % 0x10)
+    gpr += near
+    gpr += bytes(-len(gpr) % 0x10)
+    pack_into("<i", gpr, 0x28, len(gpr) - 0x10)
+    gpr += far
+
+    brntre = bytearray(b"BRNTREx86Ver2.00" + pack("<4i", boneCount, meshBoneCount, 0, 0))
+    for boneIdx in range(boneCount):
+        # mesh bone indexes are assigned in reverse so mapping is not an identity
+        meshId = meshBoneCount - 1 - boneIdx if boneIdx < meshBoneCount else -1
+        brntre += pack("<i16s4h", 0, "bone_{:03d}".format(boneIdx).encode("ascii"), boneIdx, 0, 0, meshId)
+        brntre += bytes(0x3C)
+
+    boneSect = bytearray(0x48)
+    boneSect[0:4] = b"60SE"
+    pack_into("<i", boneSect, 0x10, boneCount)
+    pack_into("<i", boneSect, 0x3C, max(boneCount - 1, 0))
+    for boneIdx in range(1, boneCount):
+        boneSect += pack("<4B", boneIdx, 0, rng.randrange(boneIdx), 0)
+    boneNamesHeader = len(boneSect)
+    pack_into("<i", boneSect, 0x30, boneNamesHeader - 0x30)
+    boneSect += bytes(0x1C) + pack("<i", 4)
+    for boneIdx in range(boneCount):
+        boneSect += "bone_{:03d}".format(boneIdx).encode("ascii") + b"\0"
+    boneSect += bytes(-len(boneSect) % 0x10)
+    pack_into("<i", boneSect, 0x18, len(boneSect) - 0x18)
+    for boneIdx in range(boneCount):
+        angle = rng.uniform(-1.0, 1.0)
+        boneSect += pack("<7f", 0.0, 0.0, angle, 1.0, rng.uniform(-10.0, 10.0), rng.uniform(-10.0, 10.0), 1.0)
+        boneSect += bytes(0x14)
+
+    sections = [meshSect, gpr, b"", brntre, boneSect]
+    headerSize = 0xC + len(sections) * 8
+    data = bytearray(pack("<3i", 0x794B504B, len(sections), 0))
+    offsets = []
+    offset = headerSize + (-headerSize % 0x10)
+    for sect in sections:
+        offsets.append(offset)
+        offset += len(sect) + (-len(sect) % 0x10)
+    data += pack("<{}i".format(len(sections)), *offsets)
+    data += pack("<{}i".format(len(sections)), *[len(sect) for sect in sections])
+    for sect in sections:
+        data += bytes(-len(data) % 0x10)
+        data += sect
+    Path(path).write_bytes(data)
+    return [name + textureExtensions[gprPlatform] for name in textureNames]
+
+
+def writeSyntheticCorpus(outDir, platforms, fileCount, meshCount, vertCount, boneCount):
+    mdlFiles = []
+    for fileIdx in range(fileCount):
+        platform = platforms[fileIdx % len(platforms)]
+        mdlFile = Path(outDir) / "bench_{}_{:03d}.mdl".format(platform, fileIdx)
+        for texName in writeSyntheticMdl(mdlFile, platform, meshCount, vertCount, boneCount, fileIdx):
+            texFile = Path(outDir) / texName
+            if not texFile.exists():
+                texFile.write_bytes(bytes(0x400))
+        mdlFiles.append(mdlFile)
+    return mdlFiles
+
+
+def collectMdlFiles(paths):
+    mdlFiles = []
+    for mdlPath in paths:
+        mdlPath = Path(mdlPath)
+        if mdlPath.is_dir():
+            mdlFiles += sorted(mdlPath.rglob("*.mdl"))
+        else:
+            mdlFiles.append(mdlPath)
+    return mdlFiles
+
+
+def loadModel(mdlFile):
+    # same steps as Noesis opening the file, returns recorded calls
+    data = mdlFile.read_bytes()
+    noesis_stub.reset()
+    rapi.setInputName(str(mdlFile))
+    if not data_fate_extella.fateCheckType(data):
+        raise ValueError("Not a Fate/Extella .mdl: " + str(mdlFile))
+    mdlList = []
+    data_fate_extella.fateLoadModel(data, mdlList)
+    return len(data)
+
+
+def scanModel(mdlFile):
+    # metadata only, sub-mesh buffers are never read
+    data = mdlFile.read_bytes()
+    noesis_stub.reset()
+    mdl = data_fate_extella.fate.MdlFile(data)
+    for subMesh in mdl.gpr.subMeshes:
+        noesis_stub.record("subMesh", (subMesh.name, subMesh.matId, subMesh.vertCount, subMesh.indexCount))
+    return len(data)
+
+
+def runBenchmark(mdlFiles, repeat, digest, loader=loadModel):
+    elapsed = 0.0
+    byteCount = 0
+    modelCount = 0
+    for _ in range(repeat):
+        for mdlFile in mdlFiles:
+            start = time.perf_counter()
+            byteCount += loader(mdlFile)
+            elapsed += time.perf_counter() - start
+            modelCount += 1
+            if digest:
+                print("{} {}".format(noesis_stub.digest(), mdlFile.name))
+    return modelCount, byteCount, elapsed
+
+
+def printReport(modelCount, byteCount, elapsed):
+    print("models: {}, size: {:.2f} MB, time: {:.2f} s".format(modelCount, byteCount / 1048576.0, elapsed))
+    print("{:.1f} models/sec, {:.2f} MB/sec".format(modelCount / elapsed if elapsed > 0 else 0.0,
+                                                   byteCount / 1048576.0 / elapsed if elapsed > 0 else 0.0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark data_fate_extella.py model loading outside of Noesis")
+    parser.add_argument("--mdl", nargs="+", help="use these .mdl files or directories instead of synthetic ones")
+    parser.add_argument("--files", type=int, default=8, help="synthetic .mdl file count")
+    parser.add_argument("--platform", choices=sorted(syntheticPlatforms) + ["all"], default="all",
+                        help="platform of synthetic files")
+    parser.add_argument("--meshes", type=int, default=20, help="sub-meshes per synthetic .mdl")
+    parser.add_argument("--verts", type=int, default=2000, help="vertices per synthetic sub-mesh")
+    parser.add_argument("--bones", type=int, default=150, help="bone count of synthetic files")
+    parser.add_argument("--repeat", type=int, default=1, help="load every file this many times")
+    parser.add_argument("--metadata", action="store_true", help="only parse metadata without reading sub-mesh buffers")
+    parser.add_argument("--digest", action="store_true", help="print hash of recorded Noesis calls of each load")
+    parser.add_argument("--profile", action="store_true", help="print cProfile stats of the load path")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpDir:
+        if args.mdl is not None:
+            mdlFiles = collectMdlFiles(args.mdl)
+        else:
+            platforms = sorted(syntheticPlatforms) if args.platform == "all" else [args.platform]
+            mdlFiles = writeSyntheticCorpus(tmpDir, platforms, args.files, args.meshes, args.verts, args.bones)
+        profile = cProfile.Profile() if args.profile else None
+        if profile is not None:
+            profile.enable()
+        loader = scanModel if args.metadata else loadModel
+        modelCount, byteCount, elapsed = runBenchmark(mdlFiles, args.repeat, args.digest, loader)
+        if profile is not None:
+            profile.disable()
+    printReport(modelCount, byteCount, elapsed)
+    if profile is not None:
+        pstats.Stats(profile).sort_stats("cumulative").print_stats(25)
+
+
+if __name__ == "__main__":
+    main()
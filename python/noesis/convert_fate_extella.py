@@ -0,0 +1,199 @@
+# Batch converter of Fate/Extella .mdl files to .npz mesh and skeleton arrays
+
+# Runs outside of Noesis on the parsing core in inc_fate_extella.py. Models are parsed in a process
+# pool, outputs that are newer than their .mdl are skipped so an interrupted run can be resumed.
+# Requires numpy.
+
+# Each .mdl is written as <out dir>/<path relative to input dir>.npz containing:
+# modelName, platform
+# boneNames, boneParents: parent index of each bone, -1 for root bones
+# boneRotations: (bones, 4) float32 local rotation xyzw, boneTranslations: (bones, 3) float32 local translation
+# materialNames, materialTextures: albedo texture name of each material, empty when there is none
+# meshNames, meshMaterials: material index of each sub-mesh
+# mesh<N>Positions: (verts, 3) float32
+# mesh<N>Uvs: (verts, 2) float16, missing when vertex layout of the mesh is unknown
+# mesh<N>BoneIndexes, mesh<N>BoneWeights: (verts, 4) uint8 skeleton bone indexes and weights of skinned meshes
+# mesh<N>Colors: (verts, 4) uint8 of meshes with vertex colors
+# mesh<N>Triangles: (triangles, 3) uint16 vertex indexes
+
+# Usage: python convert_fate_extella.py resource/target/win out_dir [--jobs 8] [--force] [--verbose]
+
+from pathlib import Path
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+import inc_fate_extella as fate
+
+# warnings of the model being converted in this process
+modelWarnings = []
+
+
+def initWorker(verbose):
+    fate.warn = modelWarnings.append
+    if not verbose:
+        fate.log = lambda msg: None
+
+
+def convertModel(job):
+    # returns (.mdl file, input size, error message or None, warnings)
+    mdlFile, outFile = job
+    del modelWarnings[:]
+    try:
+        data = mdlFile.read_bytes()
+        arrays = getModelArrays(fate.MdlFile(data))
+        outFile.parent.mkdir(parents=True, exist_ok=True)
+        tmpFile = outFile.with_name("{}.{}.tmp".format(outFile.name, os.getpid()))
+        with open(tmpFile, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmpFile, outFile)
+    except Exception as e:
+        return mdlFile, 0, "{}: {}".format(type(e).__name__, e), list(modelWarnings)
+    return mdlFile, len(data), None, list(modelWarnings)
+
+
+def getModelArrays(mdlFile):
+    mesh = mdlFile.mesh
+    arrays = {
+        "modelName": np.array(mdlFile.gpr.modelName),
+        "platform": np.array(mdlFile.impl.platform),
+    }
+
+    boneSection = mdlFile.boneSection
+    if boneSection is not None:
+        arrays["boneNames"] = np.array(boneSection.boneNames, dtype=str)
+        arrays["boneParents"] = np.array([boneSection.parentMap.get(i, -1) for i in range(boneSection.boneCount)],
+                                         dtype=np.int32)
+        arrays["boneRotations"] = np.array([x.rotation for x in boneSection.boneTransforms],
+                                           dtype=np.float32).reshape(-1, 4)
+        arrays["boneTranslations"] = np.array([x.translation for x in boneSection.boneTransforms],
+                                              dtype=np.float32).reshape(-1, 3)
+
+    arrays["materialNames"] = np.array([mesh.stringBank[mate.mateNamePrefixSid] for mate in mesh.materialInfo],
+                                       dtype=str)
+    arrays["materialTextures"] = np.array([getAlbedoTexture(mesh, mate) for mate in mesh.materialInfo], dtype=str)
+
+    subMeshes = mdlFile.gpr.subMeshes
+    arrays["meshNames"] = np.array([subMesh.name for subMesh in subMeshes], dtype=str)
+    arrays["meshMaterials"] = np.array([subMesh.matId for subMesh in subMeshes], dtype=np.int32)
+    for meshIdx, subMesh in enumerate(subMeshes):
+        prefix = "mesh{}".format(meshIdx)
+        arrays[prefix + "Positions"] = getVertexAttribute(subMesh, 0, "<f4", 3)
+        layout = subMesh.layout
+        if layout is not None:
+            arrays[prefix + "Uvs"] = getVertexAttribute(subMesh, layout.uvOffset, "<f2", 2)
+            boneBuff = subMesh.getBoneBuff()
+            if boneBuff is not None:
+                arrays[prefix + "BoneIndexes"] = np.frombuffer(boneBuff, dtype=np.uint8).reshape(-1, 4)
+                arrays[prefix + "BoneWeights"] = getVertexAttribute(subMesh, layout.weightOffset, np.uint8, 4)
+            if layout.colorOffset is not None:
+                arrays[prefix + "Colors"] = getVertexAttribute(subMesh, layout.colorOffset, np.uint8, 4)
+        faceBuff, faceCount = subMesh.getFaceList()
+        triangleCount = faceCount // 3
+        arrays[prefix + "Triangles"] = np.frombuffer(faceBuff, dtype="<u2",
+                                                     count=triangleCount * 3).reshape(triangleCount, 3)
+        subMesh.release()
+    return arrays
+
+
+def getVertexAttribute(subMesh, offset, dtype, size):
+    # strided view of one attribute of every vertex, copied to a packed array
+    dtype = np.dtype(dtype)
+    view = np.ndarray((subMesh.vertCount, size), dtype=dtype, buffer=subMesh.getVertBuff(), offset=offset,
+                      strides=(subMesh.vertStride, dtype.itemsize))
+    return np.ascontiguousarray(view)
+
+
+def getAlbedoTexture(mesh, mate):
+    if mate.texId == -1:
+        return ""
+    for sstv in mesh.textureInfo.get(mate.texId, []):
+        if mesh.stringBank[sstv.texTypeSid] in ["Albedo0", "DiffuseMap"]:
+            return os.path.splitext(os.path.basename(mesh.stringBank[sstv.texPathSid]))[0]
+    return ""
+
+
+def collectJobs(inPath, outDir, force):
+    # returns (jobs to convert, count of up to date outputs), largest models first to balance the pool
+    if inPath.is_file():
+        mdlFiles = [(inPath, Path(inPath.name))]
+    else:
+        mdlFiles = [(x, x.relative_to(inPath)) for x in sorted(inPath.rglob("*.mdl")) if x.is_file()]
+    jobs = []
+    upToDate = 0
+    for mdlFile, relPath in mdlFiles:
+        outFile = outDir / relPath.with_suffix(".npz")
+        mdlStat = mdlFile.stat()
+        if not force and isUpToDate(outFile, mdlStat):
+            upToDate += 1
+            continue
+        jobs.append((mdlStat.st_size, mdlFile, outFile))
+    jobs.sort(key=lambda x: x[0], reverse=True)
+    return [(mdlFile, outFile) for _, mdlFile, outFile in jobs], upToDate
+
+
+def isUpToDate(outFile, mdlStat):
+    try:
+        return outFile.stat().st_mtime_ns >= mdlStat.st_mtime_ns
+    except OSError:
+        return False
+
+
+def convertAll(jobs, jobCount, verbose):
+    # yields results of convertModel as models finish
+    if jobCount <= 1 or len(jobs) <= 1:
+        initWorker(verbose)
+        for job in jobs:
+            yield convertModel(job)
+        return
+    with multiprocessing.Pool(jobCount, initWorker, (verbose,)) as pool:
+        for result in pool.imap_unordered(convertModel, jobs):
+            yield result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert Fate/Extella .mdl files to .npz mesh and skeleton arrays")
+    parser.add_argument("input", help=".mdl file or directory searched recursively for .mdl files")
+    parser.add_argument("outDir", help="output directory")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument("--force", action="store_true", help="convert models even when output is up to date")
+    parser.add_argument("--verbose", action="store_true", help="print parser log of each model")
+    args = parser.parse_args()
+
+    inPath = Path(args.input)
+    if not inPath.exists():
+        parser.error("input does not exist")
+    jobs, upToDate = collectJobs(inPath, Path(args.outDir), args.force)
+
+    start = time.perf_counter()
+    converted = 0
+    failed = 0
+    byteCount = 0
+    for mdlFile, size, error, warnings in convertAll(jobs, args.jobs, args.verbose):
+        for warning in warnings:
+            print("WARNING: {}: {}".format(mdlFile, warning))
+        if error is not None:
+            failed += 1
+            print("FAILED: {}: {}".format(mdlFile, error))
+            continue
+        converted += 1
+        byteCount += size
+        if args.verbose:
+            print("Converted {}".format(mdlFile))
+    elapsed = time.perf_counter() - start
+
+    print("Converted {} models, skipped {} up to date, {} failed".format(converted, upToDate, failed))
+    print("{:.2f} MB in {:.2f} s, {:.1f} models/sec, {:.2f} MB/sec".format(
+        byteCount / 1048576.0, elapsed, converted / elapsed if elapsed > 0 else 0.0,
+        byteCount / 1048576.0 / elapsed if elapsed > 0 else 0.0))
+    if failed > 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,623 @@
+# Parsing core of data_fate_extella.py
+# Reads Fate/Extella .mdl sections (MESH, GPR, BRNTRE, 60SE) into plain Python buffers and
+# descriptors without depending on Noesis. data_fate_extella.py binds the results through rapi,
+# other scripts can use this module from regular Python.
+# Noesis does not load files prefixed with inc_ as plugins.
+
+from collections import namedtuple
+from array import array
+from bisect import bisect_left
+from itertools import compress
+import struct
+
+GprDes = namedtuple('GprDes', 'name unkId unused offset size farOffset farSize unkFlag')
+# all *Sid fields are indexes to string bank
+Sstv = namedtuple('SSTV', 'texTypeSid texPathSid texNamePrefixSid')
+Mate = namedtuple('MATE', 'matId mateNamePrefixSid mateNamePrefix2Sid unkC unk10 unk14 texIdRelated texId')
+Prim = namedtuple('PRIM', 'meshId meshGeomNameSid meshNameSid unkC meshGeomName2Sid matId unk18')
+# offsets of vertex attributes, None when not present, positions are always floats at 0
+VertexLayout = namedtuple('VertexLayout', 'uvOffset boneOffset weightOffset colorOffset')
+# quaternion xyzw and translation xyz of a bone
+BoneTransform = namedtuple('BoneTransform', 'rotation translation')
+
+# (platform, Extella Link mode, vertex stride) -> VertexLayout
+# DX11 layouts are also used by NX, not implemented for DX11:
+# 4, 8, 12 - do not have IXBF
+# 16 - unknown format, do not have IXBF probably, 20 - not used by any game model
+vertexLayouts = {
+    ("GXM", False, 19): VertexLayout(0xF, None, None, None),
+    ("GXM", False, 20): VertexLayout(0xC, None, None, None),
+    ("GXM", True, 20): VertexLayout(0x10, None, None, None),
+    ("GXM", False, 23): VertexLayout(0xF, None, None, None),
+    ("GXM", True, 23): VertexLayout(0x13, None, None, None),
+    ("GXM", False, 24): VertexLayout(0xC, None, None, None),
+    ("GXM", True, 24): VertexLayout(0x14, None, None, None),
+    ("GXM", False, 27): VertexLayout(0x17, None, None, None),
+    ("GXM", True, 27): VertexLayout(0x17, None, None, None),
+    ("GXM", False, 28): VertexLayout(0xC, None, None, None),
+    ("GXM", True, 28): VertexLayout(0x18, None, None, None),
+    ("GXM", False, 31): VertexLayout(0xF, None, None, None),  # bones 0x17, weights 0x1B?
+    ("GXM", True, 31): VertexLayout(0x13, 0x1B, 0x17, None),
+    ("GXM", False, 35): VertexLayout(0xF, None, None, None),  # bones 0x1F, weights 0x1B?
+    ("GXM", True, 35): VertexLayout(0x17, 0x1F, 0x1B, None),
+    ("DX11", False, 24): VertexLayout(0x14, None, None, None),  # 0xC, 0x10 unk floats
+    ("DX11", False, 28): VertexLayout(0x18, None, None, None),  # 0xC, 0x10, 0x14 unk floats
+    ("DX11", False, 32): VertexLayout(0x18, None, None, None),  # 0xC, 0x10, 0x14 unk floats, 0x1C unk
+    ("DX11", False, 36): VertexLayout(0x18, None, None, 0x20),  # 0xC, 0x10, 0x14 unk floats, 0x1C unk
+    ("DX11", False, 40): VertexLayout(0x18, 0x20, 0x24, None),  # 0xC, 0x10, 0x14 unk floats, 0x1C unk
+    ("DX11", False, 44): VertexLayout(0x18, 0x20, 0x24, 0x28),  # 0xC, 0x10, 0x14 unk floats, 0x1C unk
+    ("DX11", False, 48): VertexLayout(0x18, None, None, 0x2C),  # 0xC, 0x10, 0x14 unk floats, 0x1C, 0x20, 0x24, 0x28 unk
+}
+
+# (platform, Extella Link mode, vertex stride, model name, VXBF far offset) -> VertexLayout
+# for single meshes which don't follow the usual layout of their stride
+vertexLayoutOverrides = {
+    ("DX11", False, 44, "SV1310_PS4", 0x47a70): VertexLayout(0x18, 0x24, 0x28, None),
+    ("DX11", False, 44, "SV0803_PS4", 0x592c0): VertexLayout(0x18, 0x24, 0x28, None),
+}
+
+
+class MdlFile:
+    def __init__(self, data):
+        bs = ByteReader(data)
+
+        bs.seekAbs(4)
+        sectCount = bs.readInt()
+        bs.readInt()
+
+        self.sectOffsets = []
+        self.sectSizes = []
+        for _ in range(sectCount):
+            self.sectOffsets.append(bs.readInt())
+        for _ in range(sectCount):
+            self.sectSizes.append(bs.readInt())
+
+        self.impl = getPlatformImpl(bs, self.sectOffsets[0], self.sectOffsets[1])
+        self.mesh = Mesh(bs, self.sectOffsets[0])
+        self.brntre = None
+        self.boneSection = None
+        if self.mesh.bonesExist:
+            if len(self.sectOffsets) < 5:
+                warn("Mesh has bones info but section describing them does not exist")
+            else:
+                self.brntre = Brntre(bs, self.sectOffsets[3])
+                self.boneSection = BoneSection(bs, self.sectOffsets[4])
+        self.gpr = Gpr(bs, self.sectOffsets[1], self.mesh, self.boneSection, self.brntre, self.impl)
+
+
+def getPlatformImpl(bs, meshOffset, gprOffset):
+    bs.seekAbs(meshOffset)
+    if bs.readFixedString(4) != "MESH":
+        raise ValueError("MESH section expected")
+    bs.readBytes(0xC)
+    colladaVer = bs.readFixedString(31)
+    extellaLinkMode = "Collada Mesh File Version 1.009" in colladaVer
+
+    bs.seekAbs(gprOffset)
+    if bs.readString() != "GPR":
+        raise ValueError("GPR section expected")
+    bs.readBytes(0x4)
+    platform = bs.readFixedString(4)
+    log("Platform: " + platform)
+    if extellaLinkMode:
+        log("Mode: Fate/Extella Link")
+    else:
+        log("Mode: Fate/Extella")
+    if platform == "DX11":
+        return Dx11Impl()
+    elif platform == "GXM":
+        return GxmImpl(extellaLinkMode)
+    elif platform == "NX":
+        return NxImpl()
+    else:
+        raise ValueError("Unsupported platform: " + platform)
+
+
+class Mesh:
+    # Walks MESH chunks over a memoryview of the file, each record type is unpacked by one precompiled struct
+    intStruct = struct.Struct("<i")
+    chunkHeaderStruct = struct.Struct("<4si")
+    strbHeaderStruct = struct.Struct("<i4si")
+    sstvStruct = struct.Struct("<3i")
+    mateStruct = struct.Struct("<8i")
+    primStruct = struct.Struct("<7i")
+    boifStruct = struct.Struct("<2i")
+
+    def __init__(self, bs, offset):
+        view = bs.view
+        name, meshSectSize = self.chunkHeaderStruct.unpack_from(view, offset)
+        if name != b"MESH":
+            raise ValueError("MESH section expected to be first")
+        self.bonesExist = False
+        self.boneCount = -1
+        self.stringBank = []
+        self.textureInfo = {}
+        self.materialInfo = []
+        self.primInfo = []
+        self.boneIdToNameMap = {}
+
+        for name, start, end in self.iterChunks(view, offset + 8, offset + 8 + meshSectSize):
+            if name == b"STRB":
+                stringCount, strlName, _ = self.strbHeaderStruct.unpack_from(view, start)
+                if strlName != b"STRL":
+                    raise ValueError("STRL expected")
+                # whole bank is split at once, strings end with null byte
+                strings = bytes(view[start + 12:end]).split(b"\0", stringCount)[:stringCount]
+                self.stringBank.extend(x.decode("ASCII", "replace") for x in strings)
+
+            elif name == b"SAMP":
+                texId, = self.intStruct.unpack_from(view, start)
+                self.textureInfo[texId] = [Sstv._make(self.sstvStruct.unpack_from(view, subStart))
+                                           for subName, subStart, _ in self.iterChunks(view, start + 4, end)
+                                           if subName == b"SSTV"]
+
+            elif name == b"MATE":
+                self.materialInfo.append(Mate._make(self.mateStruct.unpack_from(view, start)))
+
+            elif name == b"VARI":
+                self.primInfo.extend(Prim._make(self.primStruct.unpack_from(view, subStart))
+                                     for subName, subStart, _ in self.iterChunks(view, start + 0x10, end)
+                                     if subName == b"PRIM")
+
+            elif name == b"BONE":
+                self.bonesExist = True
+                for subName, subStart, _ in self.iterChunks(view, start + 4, end):
+                    if subName == b"BOIF":
+                        nameSid, id = self.boifStruct.unpack_from(view, subStart)
+                        self.boneIdToNameMap[id] = self.stringBank[nameSid]
+
+    def iterChunks(self, view, offset, end):
+        # yields (name, data start, data end) of name + size + data chunks until end
+        while offset < end:
+            name, size = self.chunkHeaderStruct.unpack_from(view, offset)
+            offset += 8
+            yield name, offset, offset + size
+            offset += size
+
+
+class SubMesh:
+    # One VXBF/IXBF pair, vertex and index data are read from GPR far section on first access
+    # and kept until release() is called
+    # layout is None when vertex stride is unknown, bone buffer is None when mesh has no skinning,
+    # otherwise it has 4 bytes of skeleton bone indexes per vertex
+    def __init__(self, gpr, name, matId, vxbf, ixbf, vertStride, vertCount, indexCount, layout, skinned):
+        self.gpr = gpr
+        self.name = name
+        self.matId = matId
+        self.vxbf = vxbf
+        self.ixbf = ixbf
+        self.vertStride = vertStride
+        self.vertCount = vertCount
+        self.vertFarOffset = vxbf.farOffset
+        self.indexCount = indexCount
+        self.layout = layout
+        self.skinned = skinned
+        self.vertBuff = None
+        self.boneBuff = None
+        self.faceList = None
+
+    def getVertBuff(self):
+        if self.vertBuff is None:
+            self.vertBuff = self.gpr.readVertBuff(self)
+        return self.vertBuff
+
+    def getBoneBuff(self):
+        if self.boneBuff is None and self.skinned:
+            self.boneBuff = self.gpr.readBoneBuff(self)
+        return self.boneBuff
+
+    def getFaceList(self):
+        # returns (ushort triangle list, index count)
+        if self.faceList is None:
+            self.faceList = self.gpr.readFaceList(self)
+        return self.faceList
+
+    def release(self):
+        self.vertBuff = None
+        self.boneBuff = None
+        self.faceList = None
+
+
+class Gpr:
+    # Reads HEAP descriptors and buffer headers of the near section, buffers of the far section
+    # are read by SubMesh when they are needed
+    def __init__(self, bs, offset, mesh, boneSect, brntre, impl):
+        self.bs = bs
+        self.brntre = brntre
+        self.impl = impl
+        bs.seekAbs(offset)
+        if bs.readString() != "GPR":
+            raise ValueError("GPR section expected to be second")
+
+        # calculate offset for far section
+        bs.readBytes(0xC)
+        self.farOffset = bs.tell()
+        bs.readBytes(0x18)
+        self.farOffset += bs.readInt()
+
+        # go into GPR descriptors
+        bs.seekAbs(offset + 0x40)
+
+        # read HEAP
+        if bs.readFixedString(4) != "HEAP":
+            raise ValueError("HEAP data expected")
+        bs.readInt()
+        bs.readInt()
+        gprDesSize = bs.readInt()
+        bs.readInt()
+        heapSize = bs.readInt()
+        bs.readInt()
+        gprDesCount = bs.readInt()
+
+        self.descriptors = []
+        for _ in range(gprDesCount):
+            self.descriptors.append(GprDes(bs.readFixedString(4), bs.readInt(), bs.readInt(), bs.readInt(),
+                                           bs.readInt(), bs.readInt(), bs.readInt(), bs.readInt()))
+
+        bs.readBytes(heapSize)
+        self.modelName = bs.readString()
+        log("Model name: " + self.modelName)
+        bs.seekAlign(0x10)
+
+        self.nearOffset = bs.tell()
+
+        dlog("GPR near offset: " + hex(self.nearOffset))
+        dlog("GPR far offset: " + hex(self.farOffset))
+
+        # Collect IXBF, VXBF, VXST
+        ixbfList = []
+        vxbfList = []
+        vxstList = []
+        for _, des in enumerate(self.descriptors):
+            if des.name == "IXBF":
+                ixbfList.append(des)
+            if des.name == "VXBF":
+                vxbfList.append(des)
+            if des.name == "VXST":
+                vxstList.append(des)
+
+        vxstEntryCount = []
+        for _, des in enumerate(vxstList):
+            bs.seekAbs(des.offset + self.nearOffset)
+            bs.readBytes(impl.getVxstEntryCountOffset())
+            vxstEntryCount.append(bs.readInt())
+
+        vxbfEntryCount = []
+        vxbfEntryLen = []
+        for _, des in enumerate(vxbfList):
+            bs.seekAbs(des.offset + self.nearOffset)
+            bs.readBytes(0x8)
+            vxbfEntryCount.append(bs.readInt())
+            vxbfEntryLen.append(bs.readInt())
+
+        if len(vxbfList) > len(ixbfList):
+            warn("VXBF count > IXBF count, some data not processed")
+            # not sure if this will work for Link
+            idxToRemove = []
+            for i, length in enumerate(vxbfEntryLen):
+                if length <= 16:
+                    idxToRemove.append(i)
+            for idx in sorted(idxToRemove, reverse=True):
+                del vxbfList[idx]
+                del vxbfEntryCount[idx]
+                del vxbfEntryLen[idx]
+        elif len(vxbfList) < len(ixbfList):
+            warn("VXBF count < IXBF count, some data not processed")
+
+        self.subMeshes = []
+        for i, des in enumerate(vxbfList):
+            layout = resolveVertexLayout(impl, vxbfEntryLen[i], self.modelName, des.farOffset)
+            skinned = layout is not None and layout.boneOffset is not None and boneSect is not None
+            self.subMeshes.append(SubMesh(self, mesh.stringBank[mesh.primInfo[i].meshGeomNameSid],
+                                          mesh.primInfo[i].matId, des, ixbfList[i], vxbfEntryLen[i],
+                                          vxbfEntryCount[i], vxstEntryCount[i], layout, skinned))
+
+    def readVertBuff(self, subMesh):
+        self.bs.seekAbs(subMesh.vxbf.farOffset + self.farOffset)
+        dlog("Parse verts at " + hex(self.bs.tell()) + " with stride " + str(subMesh.vertStride))
+        return self.bs.readBytes(subMesh.vxbf.farSize)
+
+    def readBoneBuff(self, subMesh):
+        vertBuff = subMesh.getVertBuff()
+        layout = subMesh.layout
+        boneData = sliceVertexBytes(vertBuff, layout.boneOffset, subMesh.vertStride, subMesh.vertCount, 4)
+        weightData = sliceVertexBytes(vertBuff, layout.weightOffset, subMesh.vertStride, subMesh.vertCount, 4)
+        return self.brntre.mapBoneIndexes(boneData, weightData)
+
+    def readFaceList(self, subMesh):
+        self.bs.seekAbs(subMesh.ixbf.farOffset + self.farOffset)
+        return self.impl.getFaceList(self.bs, subMesh.indexCount)
+
+
+class Brntre:
+    def __init__(self, bs, offset):
+        bs.seekAbs(offset)
+        if bs.readFixedString(16) != "BRNTREx86Ver2.00":
+            raise ValueError("Expected section to start with 'BRNTREx86Ver2.00'")
+        boneCount = bs.readInt()
+        meshMappedBoneCount = bs.readInt()
+        bs.readInt()
+        bs.readInt()
+        self.boneMeshToSkelMap = {}
+        for _ in range(boneCount):
+            bs.readInt()
+            name = bs.readFixedString(0x10)
+            id = bs.readShort()
+            bs.readShort()
+            bs.readShort()
+            meshId = bs.readShort()
+            bs.readBytes(0x3C)
+            if meshId != -1:
+                self.boneMeshToSkelMap[meshId] = id
+        self.boneIndexTable = None
+
+    def mapBoneIndexes(self, boneData, weightData):
+        # maps mesh bone indexes of all vertices at once, indexes with zero weight or
+        # without mapping are kept as they are
+        if self.boneIndexTable is None:
+            self.boneIndexTable = bytearray(range(256))
+            for meshId, id in self.boneMeshToSkelMap.items():
+                if 0 <= meshId < 256:
+                    self.boneIndexTable[meshId] = id
+        mappedData = boneData.translate(self.boneIndexTable)
+        # 0xFF for every zero weight, merged as big integers to select original index there
+        keepMask = int.from_bytes(weightData.translate(zeroWeightMaskTable), "little")
+        if keepMask == 0:
+            return mappedData
+        merged = (int.from_bytes(boneData, "little") & keepMask) | (int.from_bytes(mappedData, "little") & ~keepMask)
+        return merged.to_bytes(len(boneData), "little")
+
+
+class BoneSection:
+    def __init__(self, bs, offset):
+        bs.seekAbs(offset)
+        if bs.readFixedString(4) != "60SE":
+            raise ValueError("Expected bone section to start with '60SE'")
+        bs.readBytes(0xC)
+
+        self.boneCount = bs.readInt()
+        bs.readInt()
+        matrixOffset = bs.tell() + bs.readInt()
+
+        bs.readBytes(0x14)
+
+        boneNamesHeaderOffset = bs.tell() + bs.readInt()
+        bs.readInt()
+        bs.readInt()
+
+        self.parentMap = {}
+        parentRelCount = bs.readInt()
+        bs.readInt()
+        bs.readInt()
+        for _ in range(parentRelCount):
+            child = bs.readUByte()
+            bs.readUByte()
+            parent = bs.readUByte()
+            bs.readUByte()
+            if child != parent:
+                self.parentMap[child] = parent
+
+        self.boneNames = []
+        bs.seekAbs(boneNamesHeaderOffset)
+        bs.readBytes(0x1C)
+        bs.seekAbs(bs.tell() + bs.readInt())
+        for _ in range(self.boneCount):
+            self.boneNames.append(bs.readString())
+
+        self.boneTransforms = []
+        bs.seekAbs(matrixOffset)
+        for _ in range(self.boneCount):
+            qx, qy, qz, qw = bs.readFloat(), bs.readFloat(), bs.readFloat(), bs.readFloat()
+            x, y, z = bs.readFloat(), bs.readFloat(), bs.readFloat()
+            bs.readBytes(0x14)
+            self.boneTransforms.append(BoneTransform((qx, qy, qz, qw), (x, y, z)))
+
+
+class GxmImpl:
+    platform = "GXM"
+    vertexLayoutPlatform = "GXM"
+
+    def __init__(self, extellaLinkMode):
+        self.extellaLinkMode = extellaLinkMode
+
+    def getFaceList(self, bs, vxstEntryCount):
+        # already a triangle list, passed through as is, incomplete last triangle is read whole
+        faceCount = (vxstEntryCount + 2) // 3 * 3
+        return bs.readBytes(faceCount * 2), faceCount
+
+    def getVxstEntryCountOffset(self):
+        return 0x10
+
+    def getTexExtensions(self):
+        return [".mxt", ".gxt"]
+
+    def getTexHandlerName(self):
+        return ".gxt"
+
+    def needsUVFlip(self):
+        return self.extellaLinkMode
+
+
+class Dx11Impl:
+    platform = "DX11"
+    vertexLayoutPlatform = "DX11"
+    extellaLinkMode = False
+
+    def getFaceList(self, bs, vxstEntryCount):
+        return stripsToTriangleList(bs.readBytes(vxstEntryCount * 2))
+
+    def getVxstEntryCountOffset(self):
+        return 0x18
+
+    def getTexExtensions(self):
+        return [".mds", ".dds"]
+
+    def getTexHandlerName(self):
+        return ".dds"
+
+    def needsUVFlip(self):
+        return False
+
+
+class NxImpl(Dx11Impl):
+    platform = "NX"
+
+    def getTexExtensions(self):
+        return [".mntx", ".bntx"]
+
+    def getTexHandlerName(self):
+        return ".bntx"
+
+
+class ByteReader:
+    # Little endian reader with the subset of NoeBitStream used by the parser
+    intStruct = struct.Struct("<i")
+    shortStruct = struct.Struct("<h")
+    floatStruct = struct.Struct("<f")
+
+    def __init__(self, data):
+        self.data = data
+        self.view = memoryview(data)
+        self.offset = 0
+
+    def tell(self):
+        return self.offset
+
+    def seekAbs(self, offset):
+        self.offset = offset
+
+    def seekAlign(self, pad):
+        if self.offset % pad == 0:
+            return
+        self.offset = (self.offset // pad + 1) * pad
+
+    def readBytes(self, size):
+        data = self.data[self.offset:self.offset + size]
+        self.offset += size
+        return data
+
+    def readInt(self):
+        value, = self.intStruct.unpack_from(self.data, self.offset)
+        self.offset += 4
+        return value
+
+    def readShort(self):
+        value, = self.shortStruct.unpack_from(self.data, self.offset)
+        self.offset += 2
+        return value
+
+    def readUByte(self):
+        value = self.data[self.offset]
+        self.offset += 1
+        return value
+
+    def readFloat(self):
+        value, = self.floatStruct.unpack_from(self.data, self.offset)
+        self.offset += 4
+        return value
+
+    def readString(self):
+        end = self.data.find(b"\0", self.offset)
+        if end == -1:
+            end = len(self.data)
+        value = self.data[self.offset:end].decode("ASCII", "replace")
+        self.offset = end + 1
+        return value
+
+    def readFixedString(self, len):
+        return self.readBytes(len).decode("ASCII").rstrip("\0")
+
+
+def resolveVertexLayout(impl, vertStride, modelName, vertFarOffset):
+    key = (impl.vertexLayoutPlatform, impl.extellaLinkMode, vertStride)
+    layout = vertexLayoutOverrides.get(key + (modelName, vertFarOffset))
+    if layout is None:
+        layout = vertexLayouts.get(key)
+    return layout
+
+
+zeroWeightMaskTable = bytes([0xFF] + [0] * 255)
+
+
+def stripsToTriangleList(indexData):
+    # converts 0xFFFF separated triangle strips to packed ushort triangle list, returns it with its index count
+    # winding alternates within each strip, degenerate triangles are dropped but still flip the winding
+    indices = array('H', indexData)
+    # triangle at position idx is degenerate when it repeats an index, found for the whole buffer at once
+    repeated = findEqualIndices(indices, indices[1:], len(indices) - 1)
+    degenerate = set(findEqualIndices(indices, indices[2:], len(indices) - 2))
+    degenerate.update(repeated)
+    degenerate.update(idx - 1 for idx in repeated)
+    degenerate = sorted(degenerate)
+    faceList = array('H')
+    stripStart = 0
+    while stripStart < len(indices):
+        # first two indexes of a strip are never treated as restart
+        stripEnd = findStripRestart(indexData, stripStart + 2)
+        if stripEnd == -1:
+            stripEnd = len(indices)
+        strip = indices[stripStart:stripEnd]
+        triStart = stripStart
+        stripStart = stripEnd + 1
+        triCount = len(strip) - 2
+        if triCount <= 0:
+            continue
+        f1, f2, f3 = strip[:-2], strip[1:-1], strip[2:]
+        f2[1::2], f3[1::2] = f3[1::2], f2[1::2]
+        triangles = array('H', bytes(triCount * 6))
+        triangles[0::3] = f1
+        triangles[1::3] = f2
+        triangles[2::3] = f3
+        keepStart = 0
+        for triIdx in degenerate[bisect_left(degenerate, triStart):bisect_left(degenerate, triStart + triCount)]:
+            faceList.extend(triangles[keepStart * 3:(triIdx - triStart) * 3])
+            keepStart = triIdx - triStart + 1
+        faceList.extend(triangles[keepStart * 3:])
+    return faceList.tobytes(), len(faceList)
+
+
+def findEqualIndices(a, b, count):
+    # positions where first count ushorts of a and b are equal
+    # compared as one integer with a 16 bit lane per index so no Python code runs per index
+    if count <= 0:
+        return []
+    diff = int.from_bytes(a[:count].tobytes(), 'little') ^ int.from_bytes(b[:count].tobytes(), 'little')
+    lowBits = int.from_bytes(b'\xFF\x7F' * count, 'little')
+    # top bit of each lane is set when the lane is not zero, adding 0x7FFF to low 15 bits never carries out of it
+    nonZero = ((diff & lowBits) + lowBits) | diff
+    equalMask = ~nonZero & int.from_bytes(b'\x00\x80' * count, 'little')
+    return list(compress(range(count), array('H', equalMask.to_bytes(count * 2, 'little'))))
+
+
+def findStripRestart(indexData, start):
+    # index of first 0xFFFF at or after start, -1 when there is none
+    offset = indexData.find(b"\xFF\xFF", start * 2)
+    while offset != -1 and offset % 2 != 0:
+        offset = indexData.find(b"\xFF\xFF", offset + 1)
+    return offset // 2 if offset != -1 else -1
+
+
+def sliceVertexBytes(vertBuff, offset, stride, vertCount, size):
+    # copies size bytes at offset of each vertex into a tightly packed buffer
+    data = bytearray(vertCount * size)
+    for byteIdx in range(size):
+        data[byteIdx::size] = vertBuff[offset + byteIdx:vertCount * stride:stride]
+    return bytes(data)
+
+
+# Helpers, the Noesis plugin replaces log and warn to write into Noesis log
+
+def dlog(msg):
+    if debug:
+        log(msg)
+
+
+def log(msg):
+    print(msg)
+
+
+def warn(msg):
+    print("WARNING: " + msg)
+
+
+debug = False
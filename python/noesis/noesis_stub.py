@@ -0,0 +1,330 @@
+# Recording stand-in for the noesis, rapi and inc_noesis modules
+
+# Lets data_fate_extella.py run its full load path outside of Noesis. Every noesis and rapi call
+# is appended to calls with byte buffers replaced by their length and CRC32, so call logs of two
+# runs can be compared or hashed with digest(). Only the parts of the Noesis API used by the
+# plugin are implemented.
+
+# Usage: import noesis_stub; noesis_stub.install(); import data_fate_extella
+
+from struct import Struct
+import hashlib
+import math
+import os
+import sys
+import types
+import zlib
+
+calls = []
+
+
+def install():
+    # registers stub modules under the names Noesis provides, must be called before importing the plugin
+    noesisModule = types.ModuleType("noesis")
+    rapiModule = types.ModuleType("rapi")
+    incModule = types.ModuleType("inc_noesis")
+    for name, value in noesisConstants.items():
+        setattr(noesisModule, name, value)
+    for name in noesisFunctions:
+        setattr(noesisModule, name, recorder(name))
+    for name in rapiFunctions:
+        setattr(rapiModule, name, recorder(name))
+    rapiModule.rpgConstructModel = rpgConstructModel
+    rapiModule.getInputName = getInputName
+    rapiModule.setInputName = setInputName
+    rapiModule.getDirForFilePath = getDirForFilePath
+    rapiModule.loadTexByHandler = loadTexByHandler
+    rapiModule.multiplyBones = multiplyBones
+    for name in incExports:
+        setattr(incModule, name, globals()[name])
+    incModule.__all__ = list(incExports)
+    sys.modules["noesis"] = noesisModule
+    sys.modules["rapi"] = rapiModule
+    sys.modules["inc_noesis"] = incModule
+
+
+def reset():
+    del calls[:]
+
+
+def digest():
+    return hashlib.md5(repr(calls).encode("utf-8")).hexdigest()
+
+
+def describe(value):
+    # plain comparable form of call arguments
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        value = bytes(value)
+        return ("bytes", len(value), zlib.crc32(value) & 0xFFFFFFFF)
+    if isinstance(value, float):
+        return round(value, 4)
+    if isinstance(value, (list, tuple)):
+        return tuple(describe(x) for x in value)
+    if hasattr(value, "describe"):
+        return value.describe()
+    return value
+
+
+def record(name, args):
+    calls.append((name,) + tuple(describe(x) for x in args))
+
+
+def recorder(name):
+    def call(*args):
+        record(name, args)
+        return 1
+
+    return call
+
+
+noesisConstants = {
+    "RPGEODATA_FLOAT": 0,
+    "RPGEODATA_INT": 1,
+    "RPGEODATA_UINT": 2,
+    "RPGEODATA_SHORT": 3,
+    "RPGEODATA_USHORT": 4,
+    "RPGEODATA_HALFFLOAT": 5,
+    "RPGEODATA_DOUBLE": 6,
+    "RPGEODATA_BYTE": 7,
+    "RPGEODATA_UBYTE": 8,
+    "RPGEO_POINTS": 0,
+    "RPGEO_TRIANGLE": 1,
+    "RPGEO_TRIANGLE_STRIP": 2,
+}
+
+noesisFunctions = ["register", "setHandlerTypeCheck", "setHandlerLoadModel", "logOutput", "logError", "logPopup"]
+
+rapiFunctions = ["rpgCreateContext", "rpgSetName", "rpgSetMaterial", "rpgSetUVScaleBias", "rpgBindPositionBuffer",
+                 "rpgBindUV1BufferOfs", "rpgBindBoneIndexBuffer", "rpgBindBoneWeightBufferOfs",
+                 "rpgBindColorBufferOfs", "rpgCommitTriangles", "rpgOptimize", "rpgClearBufferBinds"]
+
+incExports = ["NOESEEK_ABS", "NOESEEK_REL", "NoeBitStream", "NoeMaterial", "NoeModelMaterials", "NoeTexture",
+              "NoeBone", "NoeVec3", "NoeQuat", "NoeMat43"]
+
+inputName = ""
+
+
+def getInputName():
+    return inputName
+
+
+def setInputName(name):
+    global inputName
+    inputName = name
+
+
+def getDirForFilePath(filePath):
+    return os.path.dirname(filePath) + os.sep
+
+
+def loadTexByHandler(data, handlerName):
+    record("loadTexByHandler", (data, handlerName))
+    return NoeTexture("", 0, 0, bytes(data))
+
+
+def rpgConstructModel():
+    record("rpgConstructModel", ())
+    return NoeModel()
+
+
+def multiplyBones(bones):
+    # local to model space, parents are always listed before their children
+    for bone in bones:
+        if bone.parentIndex >= 0:
+            bone.setMatrix(bone.getMatrix() * bones[bone.parentIndex].getMatrix())
+    return bones
+
+
+NOESEEK_ABS = 0
+NOESEEK_REL = 1
+
+
+class NoeBitStream:
+    int32 = Struct("<i")
+    int16 = Struct("<h")
+    uint8 = Struct("<B")
+    float32 = Struct("<f")
+
+    def __init__(self, data):
+        self.data = bytes(data)
+        self.offset = 0
+
+    def tell(self):
+        return self.offset
+
+    def seek(self, offset, whence=NOESEEK_ABS):
+        self.offset = offset if whence == NOESEEK_ABS else self.offset + offset
+
+    def getSize(self):
+        return len(self.data)
+
+    def readBytes(self, size):
+        value = self.data[self.offset:self.offset + size]
+        self.offset += size
+        return value
+
+    def readInt(self):
+        value, = self.int32.unpack_from(self.data, self.offset)
+        self.offset += 4
+        return value
+
+    def readShort(self):
+        value, = self.int16.unpack_from(self.data, self.offset)
+        self.offset += 2
+        return value
+
+    def readUByte(self):
+        value, = self.uint8.unpack_from(self.data, self.offset)
+        self.offset += 1
+        return value
+
+    def readFloat(self):
+        value, = self.float32.unpack_from(self.data, self.offset)
+        self.offset += 4
+        return value
+
+    def readString(self):
+        end = self.data.find(b"\0", self.offset)
+        if end == -1:
+            end = len(self.data)
+        value = self.data[self.offset:end].decode("ASCII", "replace")
+        self.offset = end + 1
+        return value
+
+
+class NoeTexture:
+    def __init__(self, name, width, height, pixelData):
+        self.name = name
+        self.width = width
+        self.height = height
+        self.pixelData = pixelData
+
+    def describe(self):
+        return ("NoeTexture", self.name, describe(self.pixelData))
+
+
+class NoeMaterial:
+    def __init__(self, name, texName):
+        self.name = name
+        self.texName = texName
+        self.normalTexName = ""
+        self.specularTexName = ""
+        self.envTexName = ""
+        self.defaultBlend = 1
+
+    def setTexture(self, texName):
+        self.texName = texName
+
+    def setNormalTexture(self, texName):
+        self.normalTexName = texName
+
+    def setSpecularTexture(self, texName):
+        self.specularTexName = texName
+
+    def setEnvTexture(self, texName):
+        self.envTexName = texName
+
+    def setDefaultBlend(self, blend):
+        self.defaultBlend = blend
+
+    def describe(self):
+        return ("NoeMaterial", self.name, self.texName, self.normalTexName, self.specularTexName, self.envTexName,
+                self.defaultBlend)
+
+
+class NoeModelMaterials:
+    def __init__(self, texList, matList):
+        self.texList = texList
+        self.matList = matList
+
+    def describe(self):
+        return ("NoeModelMaterials", describe(self.texList), describe(self.matList))
+
+
+class NoeModel:
+    def __init__(self):
+        self.modelMats = None
+        self.bones = []
+
+    def setModelMaterials(self, modelMats):
+        record("setModelMaterials", (modelMats,))
+        self.modelMats = modelMats
+
+    def setBones(self, bones):
+        record("setBones", (bones,))
+        self.bones = bones
+
+
+class NoeBone:
+    def __init__(self, index, name, matrix, parentName=None, parentIndex=-1):
+        self.index = index
+        self.name = name
+        self._matrix = matrix
+        self.parentName = parentName
+        self.parentIndex = parentIndex
+
+    def getMatrix(self):
+        return self._matrix
+
+    def setMatrix(self, matrix):
+        self._matrix = matrix
+
+    def describe(self):
+        return ("NoeBone", self.index, self.name, self.parentIndex, describe(self._matrix))
+
+
+class NoeVec3:
+    def __init__(self, vec=(0.0, 0.0, 0.0)):
+        self.vec3 = [float(x) for x in vec]
+
+    def __getitem__(self, index):
+        return self.vec3[index]
+
+    def __setitem__(self, index, value):
+        self.vec3[index] = float(value)
+
+    def describe(self):
+        return describe(self.vec3)
+
+
+class NoeMat43:
+    def __init__(self, rows=((1.0, 0.0, 0.0), (0.0, 1.0, 0.0), (0.0, 0.0, 1.0), (0.0, 0.0, 0.0))):
+        self.mat43 = [NoeVec3(row) for row in rows]
+
+    def __getitem__(self, index):
+        return self.mat43[index]
+
+    def __setitem__(self, index, value):
+        self.mat43[index] = NoeVec3(value.vec3 if isinstance(value, NoeVec3) else value)
+
+    def __mul__(self, other):
+        # row vectors, self is applied first
+        rows = []
+        for i in range(4):
+            row = self.mat43[i]
+            rows.append([row[0] * other[0][j] + row[1] * other[1][j] + row[2] * other[2][j]
+                         + (other[3][j] if i == 3 else 0.0) for j in range(3)])
+        return NoeMat43(rows)
+
+    def describe(self):
+        return describe(self.mat43)
+
+
+class NoeQuat:
+    def __init__(self, quat=(0.0, 0.0, 0.0, 1.0)):
+        self.quat = [float(x) for x in quat]
+
+    def toMat43(self, transposed=0):
+        x, y, z, w = self.quat
+        length = math.sqrt(x * x + y * y + z * z + w * w)
+        if length > 0.0:
+            x, y, z, w = x / length, y / length, z / length, w / length
+        rows = [[1.0 - 2.0 * (y * y + z * z), 2.0 * (x * y + w * z), 2.0 * (x * z - w * y)],
+                [2.0 * (x * y - w * z), 1.0 - 2.0 * (x * x + z * z), 2.0 * (y * z + w * x)],
+                [2.0 * (x * z + w * y), 2.0 * (y * z - w * x), 1.0 - 2.0 * (x * x + y * y)]]
+        if transposed:
+            rows = [list(col) for col in zip(*rows)]
+        return NoeMat43(rows + [[0.0, 0.0, 0.0]])
+
+    def describe(self):
+        return describe(self.quat)